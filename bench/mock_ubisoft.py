@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+
+class MockUbisoft:
+    """ Local stand-in for the Ubisoft login and marketplace GraphQL endpoints
+
+    Every item keeps a small random-walk order book, and each lookup has a
+    `sale_rate` chance of reporting a new last sale (and moving the book);
+    otherwise the item comes back unchanged. `error_rate` nulls out
+    single items (a partial batch failure), while `rate_limit_rate` fails a
+    whole request the way Ubisoft does when throttling.
+    """
+
+    def __init__(
+            self,
+            item_ids: list[str],
+            latency: float = 0.0,
+            jitter: float = 0.0,
+            error_rate: float = 0.0,
+            rate_limit_rate: float = 0.0,
+            sale_rate: float = 0.2,
+            seed: int = 0,
+    ):
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.error_rate: float = error_rate
+        self.rate_limit_rate: float = rate_limit_rate
+        self.sale_rate: float = sale_rate
+        self.random: random.Random = random.Random(seed)
+
+        self.items: dict[str, dict] = {
+            item_id: {"price": self.random.randint(100, 20000), "sold_at": time.time(), "buyers": 0, "sellers": 0}
+            for item_id in item_ids
+        }
+
+        self.logins: int = 0
+        self.requests: int = 0
+        self.rate_limited: int = 0
+        self.item_errors: int = 0
+
+        self.app: web.Application = web.Application()
+        self.app.router.add_post("/v3/profiles/sessions", self.sessions)
+        self.app.router.add_post("/v1/profiles/me/uplay/graphql", self.graphql)
+        self.runner: web.AppRunner | None = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """ Starts serving, returning the base URL to hand to Auth """
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def _delay(self) -> None:
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def sessions(self, request: web.Request) -> web.Response:
+        await self._delay()
+        self.logins += 1
+
+        expiration = datetime.now(timezone.utc) + timedelta(hours=3)
+        return web.json_response({
+            "ticket": uuid.uuid4().hex,
+            "expiration": expiration.strftime("%Y-%m-%dT%H:%M:%S.%f0Z"),
+            "sessionId": str(uuid.uuid4()),
+            "profileId": str(uuid.uuid4()),
+            "spaceId": "0d2ae42d-4c27-4cb7-af6c-2099062302bb",
+            "userId": str(uuid.uuid4()),
+        })
+
+    def _block(self, item_id: str) -> dict:
+        state = self.items[item_id]
+        if self.random.random() < self.sale_rate:
+            state["price"] = max(10, state["price"] + self.random.randint(-500, 500))
+            state["sold_at"] = time.time()
+            state["buyers"] = self.random.randint(0, 500)
+            state["sellers"] = self.random.randint(0, 500)
+        price = state["price"]
+
+        return {
+            "id": item_id,
+            "item": {
+                "id": item_id,
+                "assetUrl": f"https://example.invalid/{item_id}.png",
+                "itemId": item_id,
+                "name": f"item {item_id[:8]}",
+                "tags": ["bench"],
+                "type": "WeaponSkin",
+            },
+            "marketData": {
+                "id": item_id,
+                "sellStats": [{"id": item_id, "paymentItemId": "credits", "lowestPrice": price + 50, "highestPrice": price * 3, "activeCount": state["sellers"]}],
+                "buyStats": [{"id": item_id, "paymentItemId": "credits", "lowestPrice": 10, "highestPrice": price - 50, "activeCount": state["buyers"]}],
+                "lastSoldAt": [{"id": item_id, "paymentItemId": "credits", "price": price, "performedAt": datetime.fromtimestamp(state["sold_at"], timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f0Z")}],
+            },
+        }
+
+    async def graphql(self, request: web.Request) -> web.Response:
+        body = json.loads(await request.read())
+        variables = body.get("variables", {})
+        await self._delay()
+        self.requests += 1
+
+        if self.random.random() < self.rate_limit_rate:
+            self.rate_limited += 1
+            return web.json_response({"errors": [{"message": "Too many requests"}], "data": None})
+
+        if "offset" in variables:
+            ordered = sorted(self.items)
+            offset, limit = variables["offset"] or 0, variables["limit"]
+            nodes = [{"id": item_id, "item": self._block(item_id)["item"]} for item_id in ordered[offset:offset + limit]]
+            return web.json_response({"data": {"game": {"id": "game", "marketableItems": {"nodes": nodes, "totalCount": len(ordered)}}}})
+
+        if "itemId" in variables:
+            if self.random.random() < self.error_rate:
+                self.item_errors += 1
+                return web.json_response({"errors": [{"message": "Internal error", "path": ["game", "marketableItem"]}], "data": None})
+            return web.json_response({"data": {"game": {"id": "game", "marketableItem": self._block(variables["itemId"])}}})
+
+        game = {"id": "game"}
+        errors = []
+        for name, item_id in variables.items():
+            if not name.startswith("itemId"):
+                continue
+            alias = f'item{name[len("itemId"):]}'
+            if self.random.random() < self.error_rate:
+                self.item_errors += 1
+                game[alias] = None
+                errors.append({"message": "Internal error", "path": ["game", alias]})
+            else:
+                game[alias] = self._block(item_id)
+
+        response = {"data": {"game": game}}
+        if errors:
+            response["errors"] = errors
+        return web.json_response(response)
@@ -0,0 +1,137 @@
+""" Offline scan throughput benchmark
+
+Drives Auth, MarketScanner and Market against a local MockUbisoft over
+synthetic catalogs, no credentials needed:
+
+    python -m bench.scan_bench --items 100 1000 10000 --latency 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import sqlite3
+import tempfile
+import time
+import uuid
+
+import aiohttp
+
+from bench.mock_ubisoft import MockUbisoft
+from market import Market
+from pool import ConnectionPool
+from scanner import MarketScanner
+from store import MarketStore
+from ubisoft import Auth
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def checkpoint_bytes(db: sqlite3.Connection) -> int:
+    """ Bytes written to the WAL since the last checkpoint, which this one truncates
+
+    File sizes are no use here since SQLite reuses the WAL after a checkpoint.
+    """
+    # TRUNCATE reports the emptied log, so read the frame count from a FULL checkpoint first
+    _, frames, _ = db.execute("PRAGMA wal_checkpoint(FULL)").fetchone()
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    page_size, = db.execute("PRAGMA page_size").fetchone()
+    return max(frames, 0) * page_size
+
+
+async def bench_catalog(size: int, args: argparse.Namespace) -> list[dict]:
+    item_ids = {f"bench item {i}": str(uuid.UUID(int=i + 1)) for i in range(size)}
+    mock = MockUbisoft(
+        list(item_ids.values()),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        sale_rate=args.sale_rate,
+    )
+    base_url = await mock.start()
+
+    # Time every HTTP request from the client's side
+    latencies = []
+    trace = aiohttp.TraceConfig()
+    async def on_start(session, ctx, params):
+        ctx.start = time.perf_counter()
+    async def on_end(session, ctx, params):
+        latencies.append(time.perf_counter() - ctx.start)
+    trace.on_request_start.append(on_start)
+    trace.on_request_end.append(on_end)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        auth = Auth(
+            token="bench",
+            creds_path=f"{tmp}/creds.json",
+            pool=ConnectionPool(limit_per_host=max(args.concurrency, 1), trace_configs=[trace]),
+            base_url=base_url,
+        )
+        db_path = f"{tmp}/market.db"
+        market = Market(MarketStore(db_path), verbose=False)
+        scanner = MarketScanner(auth, concurrency=args.concurrency, rate=args.rate, batch_size=args.batch_size)
+
+        for pass_no in range(args.passes):
+            latencies.clear()
+            requests_before = mock.requests
+            checkpoint_bytes(market.store.db)
+
+            changed = await market.scan(scanner, item_ids)
+
+            results.append({
+                "items": size,
+                "pass": pass_no + 1,
+                "seconds": scanner.last_pass_duration,
+                "items_per_sec": size / max(scanner.last_pass_duration, 1e-9),
+                "requests": mock.requests - requests_before,
+                "failed": scanner.last_pass_failures,
+                "changed": changed,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "bytes_persisted": checkpoint_bytes(market.store.db),
+                "reuse_ratio": auth.pool.stats()["reuse_ratio"],
+            })
+
+        await auth.close()
+        await auth.pool.close()
+        market.store.close()
+    await mock.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[100, 1000, 10000], help="catalog sizes to benchmark")
+    parser.add_argument("--passes", type=int, default=3, help="scan passes per catalog")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=1000.0, help="scanner requests per second")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05, help="mock server latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="chance of an item failing inside a response")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="chance of a whole request being rate limited")
+    parser.add_argument("--sale-rate", type=float, default=0.2, help="chance of an item reporting a new sale per lookup")
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.items:
+        results += asyncio.run(bench_catalog(size, args))
+
+    print(f'{"items":>7} {"pass":>4} {"seconds":>8} {"items/s":>9} {"reqs":>6} {"failed":>6} {"changed":>7} {"p50 ms":>8} {"p99 ms":>8} {"bytes":>10} {"reuse":>6}')
+    for r in results:
+        print(f'{r["items"]:>7} {r["pass"]:>4} {r["seconds"]:>8.2f} {r["items_per_sec"]:>9.1f} {r["requests"]:>6} {r["failed"]:>6} {r["changed"]:>7} {r["p50_ms"]:>8.1f} {r["p99_ms"]:>8.1f} {r["bytes_persisted"]:>10} {r["reuse_ratio"]:>6.2f}')
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import glob
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+from item_details import ItemDetails, json_dumps, json_loads, parse_item_details, parse_marketable_item
+
+# Every record: float64 capture time, uint32 metadata length, metadata JSON,
+# uint32 body length, then the response body exactly as Ubisoft sent it
+RECORD_HEADER = struct.Struct("<dI")
+BODY_HEADER = struct.Struct("<I")
+
+
+class CaptureWriter:
+    """ Appends raw GraphQL responses to zlib-compressed, time-segmented files
+
+    Writes are handed to a background thread, so capturing never blocks the
+    event loop. A segment is written as `<prefix>-<start ms>.cap.part` and
+    renamed to `.cap` once it is closed, after `segment_seconds` or
+    `segment_bytes` of raw input, so replays only ever see whole segments.
+    The open segment is sync-flushed whenever the queue runs dry (and at
+    least every `flush_seconds`), so a killed process loses at most that
+    much of it to `replay.py --partial`.
+    """
+
+    def __init__(self, directory: str, prefix: str = "capture", segment_seconds: float = 3600, segment_bytes: int = 256 * 1024 * 1024, flush_seconds: float = 1.0):
+        self.directory: str = directory
+        self.prefix: str = prefix
+        self.segment_seconds: float = segment_seconds
+        self.segment_bytes: int = segment_bytes
+        self.flush_seconds: float = flush_seconds
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: threading.Thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, operation: str, variables: dict, body: bytes, captured_at: float = None) -> None:
+        self._queue.put((time.time() if captured_at is None else captured_at, operation, variables, body))
+
+    def close(self) -> None:
+        """ Flushes everything queued so far and closes the open segment """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        # Only this thread touches the open segment
+        self._file = None
+        while True:
+            record = self._queue.get()
+            if record is None:
+                self._close_segment()
+                return
+
+            captured_at, operation, variables, body = record
+            if self._file is not None and (captured_at - self._started >= self.segment_seconds or self._written >= self.segment_bytes):
+                self._close_segment()
+            if self._file is None:
+                self._open_segment(captured_at)
+
+            meta = json_dumps({"op": operation, "vars": variables})
+            chunk = RECORD_HEADER.pack(captured_at, len(meta)) + meta + BODY_HEADER.pack(len(body)) + body
+            self._file.write(self._compressor.compress(chunk))
+            self._written += len(chunk)
+            if self._queue.empty() or time.monotonic() - self._flushed >= self.flush_seconds:
+                self._sync()
+
+    def _sync(self) -> None:
+        # Everything written so far becomes decodable without ending the zlib stream
+        self._file.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        self._file.flush()
+        self._flushed = time.monotonic()
+
+    def _open_segment(self, started: float) -> None:
+        self._path = os.path.join(self.directory, f'{self.prefix}-{round(started * 1000)}.cap.part')
+        self._file = open(self._path, "wb")
+        self._compressor = zlib.compressobj(6)
+        self._started = started
+        self._written = 0
+        self._flushed = time.monotonic()
+
+    def _close_segment(self) -> None:
+        if self._file is None:
+            return
+        self._file.write(self._compressor.flush())
+        self._file.close()
+        os.replace(self._path, self._path[:-len(".part")])
+        self._file = None
+
+
+def _segment_start(path: str) -> int:
+    return int(os.path.basename(path).split(".", 1)[0].rsplit("-", 1)[1])
+
+def segments(directory: str, partial: bool = False) -> list[str]:
+    """ Closed segments in `directory` (plus unfinished ones if `partial`), oldest first """
+    paths = glob.glob(os.path.join(directory, "*.cap"))
+    if partial:
+        paths += glob.glob(os.path.join(directory, "*.cap.part"))
+    return sorted(paths, key=_segment_start)
+
+def read_segment(path: str):
+    """ Yields (captured_at, operation, variables, body) for every record in a segment
+
+    A segment cut short by a crash yields every record before the cut.
+    """
+    with open(path, "rb") as f:
+        buf = zlib.decompressobj().decompress(f.read())
+
+    pos = 0
+    while pos + RECORD_HEADER.size <= len(buf):
+        captured_at, meta_len = RECORD_HEADER.unpack_from(buf, pos)
+        meta_end = pos + RECORD_HEADER.size + meta_len
+        if meta_end + BODY_HEADER.size > len(buf):
+            return
+        body_len, = BODY_HEADER.unpack_from(buf, meta_end)
+        body_start = meta_end + BODY_HEADER.size
+        if body_start + body_len > len(buf):
+            return
+
+        meta = json_loads(buf[pos + RECORD_HEADER.size:meta_end])
+        yield captured_at, meta["op"], meta["vars"], buf[body_start:body_start + body_len]
+        pos = body_start + body_len
+
+
+def extract_items(operation: str, variables: dict, body: bytes) -> list[tuple[str, ItemDetails]]:
+    """ (item_id, ItemDetails) pairs in one captured response, as try_query_db(_batch) would have parsed them """
+    try:
+        res = json_loads(body)
+    except ValueError:
+        return []
+    if not isinstance(res, dict):
+        return []
+
+    if operation == "GetItemDetails":
+        if "errors" in res:
+            return []
+        return [(variables["itemId"], parse_item_details(res))]
+
+    if operation == "GetItemDetailsBatch":
+        game = (res.get("data") or {}).get("game") or {}
+        items = []
+        for name, item_id in variables.items():
+            if not name.startswith("itemId"):
+                continue
+            block = game.get(f'item{name[len("itemId"):]}')
+            if block:
+                items.append((item_id, parse_marketable_item(block)))
+        return items
+
+    return []
+
+def parse_segment(path: str) -> list[tuple[float, str, ItemDetails]]:
+    """ Every (captured_at, item_id, ItemDetails) in a segment; runs in replay worker processes """
+    parsed = []
+    for captured_at, operation, variables, body in read_segment(path):
+        for item_id, res in extract_items(operation, variables, body):
+            parsed.append((captured_at, item_id, res))
+    return parsed
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import bisect
+import json
+import os
+from collections import defaultdict
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Catalog:
+    """ Tracked item names and ids from ids.json, reloaded only when the file changes """
+
+    def __init__(self, path: str = "assets/ids.json"):
+        self.path: str = path
+        self.mtime: float | None = None
+        self.ids: dict[str, str] = {}
+        self._names: list[str] = []
+        self._grams: dict[str, list[str]] = {}
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """ Reloads the file if its mtime changed since the last load """
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return False
+        if mtime == self.mtime:
+            return False
+
+        with open(self.path, "r") as f:
+            ids = json.load(f)
+
+        self.load({name.lower(): item_id for name, item_id in ids.items()})
+        self.mtime = mtime
+        print(f"[ Loaded {len(self.ids)} tracked items from '{self.path}' ]")
+        return True
+
+    def load(self, ids: dict[str, str]) -> None:
+        """ Replaces the catalog contents and rebuilds the lookup indexes """
+        grams = defaultdict(list)
+        for name in ids:
+            for gram in _trigrams(name):
+                grams[gram].append(name)
+
+        self.ids = ids
+        self._names = sorted(ids)
+        self._grams = dict(grams)
+
+    def add(self, entries: list[tuple[str, str]]) -> int:
+        """ Tracks new (name, item_id) pairs in place, without rebuilding the indexes, and saves them to the file
+
+        Items whose id is already tracked are skipped. A name that is already
+        taken by another item gets (the start of) its id appended. Returns the
+        number of items added.
+        """
+        # Pick up any hand edits first, so saving can't hide them
+        self.refresh()
+
+        tracked = set(self.ids.values())
+        added = {}
+        for name, item_id in entries:
+            if item_id in tracked:
+                continue
+            base = name
+            if name.lower() in self.ids:
+                name = f'{base} ({item_id[:8]})'
+            if name.lower() in self.ids:
+                name = f'{base} ({item_id})'
+
+            key = name.lower()
+            self.ids[key] = item_id
+            bisect.insort(self._names, key)
+            for gram in _trigrams(key):
+                self._grams.setdefault(gram, []).append(key)
+            tracked.add(item_id)
+            added[name] = item_id
+
+        if added:
+            self.save(added)
+        return len(added)
+
+    def save(self, added: dict[str, str]) -> None:
+        """ Appends `added` to the catalog file, atomically, leaving every existing entry exactly as written """
+        try:
+            with open(self.path, "r") as f:
+                ids = json.load(f)
+        except FileNotFoundError:
+            ids = {}
+        ids.update(added)
+
+        with open(f'{self.path}.tmp', 'w') as f:
+            json.dump(ids, f, indent=4)
+        os.replace(f'{self.path}.tmp', self.path)
+
+        # Our own write shouldn't trigger a reload
+        self.mtime = os.stat(self.path).st_mtime
+
+    def items(self):
+        return self.ids.items()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self.ids
+
+    def with_prefix(self, prefix: str, limit: int = 25) -> list[str]:
+        """ Names starting with `prefix`, in alphabetical order """
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._names, prefix)
+        matches = []
+        for name in self._names[start:start + limit]:
+            if not name.startswith(prefix):
+                break
+            matches.append(name)
+        return matches
+
+    def fuzzy(self, query: str, limit: int = 5, cutoff: float = 0.3) -> list[tuple[float, str]]:
+        """ Names sharing the most trigrams with `query`, scored by Jaccard similarity """
+        query_grams = _trigrams(query.lower())
+
+        shared = defaultdict(int)
+        for gram in query_grams:
+            for name in self._grams.get(gram, ()):
+                shared[name] += 1
+
+        scored = []
+        for name, count in shared.items():
+            score = count / (len(query_grams) + len(_trigrams(name)) - count)
+            if score >= cutoff:
+                scored.append((score, name))
+        scored.sort(reverse=True)
+        return scored[:limit]
+
+    def resolve(self, query: str) -> str | None:
+        """ Finds the name best matching `query`: exact, then unique prefix, then fuzzy """
+        query = query.lower().strip()
+        if query in self.ids:
+            return query
+
+        prefixed = self.with_prefix(query, limit=2)
+        if len(prefixed) == 1:
+            return prefixed[0]
+
+        matches = self.fuzzy(query, limit=1)
+        return matches[0][1] if matches else None
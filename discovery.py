@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+
+from catalog import Catalog
+
+
+class Discovery:
+    """ Walks the marketplace listing page by page, adding unknown items to the catalog
+
+    The listing offset is saved after every page, so an interrupted walk
+    picks up where it stopped instead of starting over. Once the end of the
+    listing is reached the cursor goes back to 0 for the next walk.
+    """
+
+    def __init__(self, auth, catalog: Catalog, state_path: str = "assets/discovery.json", page_size: int = 100):
+        self.auth = auth
+        self.catalog: Catalog = catalog
+        self.state_path: str = state_path
+        self.page_size: int = page_size
+        self.state: dict = {"offset": 0, "completed_at": None}
+
+        if os.path.exists(state_path):
+            with open(state_path, "r") as f:
+                self.state.update(json.load(f))
+
+    def _save_state(self) -> None:
+        with open(f'{self.state_path}.tmp', 'w') as f:
+            json.dump(self.state, f)
+        os.replace(f'{self.state_path}.tmp', self.state_path)
+
+    async def run(self) -> int:
+        """ Walks from the saved offset to the end of the listing, returning how many items were added """
+        print(f'[ Discovering items from offset {self.state["offset"]}... ]')
+        added = 0
+        async for offset, page in self.auth.iter_marketable_items(self.state["offset"], self.page_size):
+            added += self.catalog.add(page)
+            self.state["offset"] = offset
+            self._save_state()
+
+        self.state["offset"] = 0
+        self.state["completed_at"] = time.time()
+        self._save_state()
+        print(f'[ Discovery finished, {added} new items ({len(self.catalog)} tracked) ]')
+        return added
@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import json
+
+import numpy as np
+from websockets.asyncio.server import Server, ServerConnection, serve
+from websockets.exceptions import ConnectionClosed
+
+# Most sales queued for one item while a client is behind
+MAX_PENDING_SALES = 100
+
+
+class FeedClient:
+    """ One WebSocket subscriber and the updates waiting to be sent to it
+
+    Pending updates are keyed by item, so a client that can't keep up gets
+    one merged update per item (latest snapshot, every sale since) instead of
+    an ever-growing backlog.
+    """
+
+    def __init__(self, connection: ServerConnection):
+        self.connection: ServerConnection = connection
+        self.items: set[str] | None = set()
+        self.pending: dict[str, dict] = {}
+        self.ready: asyncio.Event = asyncio.Event()
+
+    def wants(self, item_id: str) -> bool:
+        return self.items is None or item_id in self.items
+
+    def queue(self, item_id: str, update: dict) -> None:
+        pending = self.pending.setdefault(item_id, {"i": item_id})
+        if "d" in update:
+            pending["d"] = update["d"]
+        if "s" in update:
+            pending["s"] = (pending.get("s", []) + update["s"])[-MAX_PENDING_SALES:]
+        self.ready.set()
+
+
+class PriceFeed:
+    """ Pushes item updates to local WebSocket clients as they are ingested
+
+    Clients send {"subscribe": [item ids]} or {"subscribe": "*"} (and the
+    same with "unsubscribe") and receive JSON lists of deltas:
+    {"i": item id, "d": [6 order-book values], "s": [[price, sold at], ...]}
+    where "d" is only present if the snapshot changed and "s" only holds
+    sales the client hasn't been sent yet.
+    """
+
+    def __init__(self, data: dict):
+        self.data: dict = data
+        self.clients: set[FeedClient] = set()
+        self.server: Server | None = None
+
+        # What the last published update for each item already covered
+        self._snapshots: dict[str, list | None] = {}
+        self._last_sold: dict[str, float] = {}
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> None:
+        self.server = await serve(self._handle, host, port)
+        print(f"[ Serving the price feed on ws://{host}:{port} ]")
+
+    def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+
+    def _full_update(self, item_id: str) -> dict:
+        item = self.data[item_id]
+        update = {"d": item["data"]}
+        if len(item["sold"]):
+            price, sold_at = item["sold"][-1]
+            update["s"] = [[price, sold_at]]
+        return update
+
+    def publish(self, item_id: str) -> None:
+        """ Market listener: queues what changed for `item_id` since it was last published """
+        item = self.data[item_id]
+        times = item["sold"].times
+        update = {}
+
+        if item["data"] != self._snapshots.get(item_id):
+            self._snapshots[item_id] = item["data"]
+            update["d"] = item["data"]
+
+        last_sold = self._last_sold.get(item_id)
+        if len(times) and times[-1] != last_sold:
+            # Ingest adds at most one sale per change, so an item seen for the first time only sends its latest
+            start = len(times) - 1 if last_sold is None else int(np.searchsorted(times, last_sold, side="right"))
+            start = max(start, len(times) - MAX_PENDING_SALES)
+            prices = item["sold"].prices[start:].tolist()
+            update["s"] = [[price or None, sold_at] for price, sold_at in zip(prices, times[start:].tolist())]
+            self._last_sold[item_id] = float(times[-1])
+
+        if update:
+            for client in self.clients:
+                if client.wants(item_id):
+                    client.queue(item_id, update)
+
+    async def _handle(self, connection: ServerConnection) -> None:
+        client = FeedClient(connection)
+        self.clients.add(client)
+        sender = asyncio.ensure_future(self._send_loop(client))
+        try:
+            async for message in connection:
+                self._apply(client, message)
+        except ConnectionClosed:
+            pass
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+
+    def _apply(self, client: FeedClient, message: str | bytes) -> None:
+        try:
+            request = json.loads(message)
+        except ValueError:
+            return
+        if not isinstance(request, dict):
+            return
+
+        subscribe = request.get("subscribe")
+        if subscribe == "*":
+            client.items = None
+        elif isinstance(subscribe, list):
+            if client.items is not None:
+                client.items.update(subscribe)
+            # New subscribers start from the current state of each item
+            for item_id in subscribe:
+                if item_id in self.data:
+                    client.queue(item_id, self._full_update(item_id))
+
+        unsubscribe = request.get("unsubscribe")
+        if unsubscribe == "*":
+            client.items = set()
+            client.pending.clear()
+        elif isinstance(unsubscribe, list) and client.items is not None:
+            for item_id in unsubscribe:
+                client.items.discard(item_id)
+                client.pending.pop(item_id, None)
+
+    async def _send_loop(self, client: FeedClient) -> None:
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                pending, client.pending = client.pending, {}
+                if pending:
+                    # Everything that piled up while the last send was in flight goes out together
+                    await client.connection.send(json.dumps(list(pending.values()), separators=(",", ":")))
+        except ConnectionClosed:
+            pass
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import io
+import asyncio
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+
+def render_graph(title: str, prices, times, unit: str, dividend: float, now: float) -> bytes:
+    """ Draws the sale scatter and trendline for one item, returning PNG bytes
+
+    Runs inside a worker process, so it only uses its own Figure and never
+    touches pyplot's shared global state.
+    """
+    import numpy as np
+    from matplotlib.figure import Figure
+
+    x = (now - np.asarray(times, dtype=np.float64)) / dividend
+    y = np.asarray(prices, dtype=np.float64)
+
+    fig = Figure()
+    ax = fig.subplots()
+    ax.scatter( x, y )
+    ax.set_xlabel( f' Time ({unit} ago) ' )
+    ax.set_ylabel( " Purchase Amount " )
+
+    if len(x) > 1:
+        trendline_function = np.poly1d( np.polyfit( x, y, 1 ) )
+        ax.plot( x, trendline_function(x) )
+    ax.set_title( title )
+
+    buf = io.BytesIO()
+    fig.savefig( buf, format="png" )
+    return buf.getvalue()
+
+
+class GraphRenderer:
+    """ Renders graphs in a process pool, caching finished images and sharing in-flight renders """
+
+    def __init__(self, max_workers: int = 2, cache_size: int = 128):
+        # spawn keeps workers from inheriting the bot's threads and sockets
+        self.pool: ProcessPoolExecutor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self.cache_size: int = cache_size
+        self.cache: OrderedDict[tuple, bytes] = OrderedDict()
+        self.inflight: dict[tuple, asyncio.Future] = {}
+
+    def _finish(self, key: tuple, future: asyncio.Future) -> None:
+        self.inflight.pop(key, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        self.cache[key] = future.result()
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def render(self, key: tuple, *args) -> bytes:
+        """ Returns the PNG for `key`, rendering it with render_graph(*args) only if needed
+
+        `key` should identify everything the image depends on, e.g. the item,
+        window, unit and timestamp of the newest sample.
+        """
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        future = self.inflight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self.pool, render_graph, *args)
+            future.add_done_callback(lambda f: self._finish(key, f))
+            self.inflight[key] = future
+
+        # shield so one impatient caller can't cancel the render for everyone else
+        return await asyncio.shield(future)
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import os
+
+import numpy as np
+
+# Column files start with a 16 byte header: magic, padding, then the sample count
+HEADER_SIZE = 16
+MAGIC = b"R6PH\0\0\0\0"
+
+
+class PriceHistory:
+    """ Append-only sale history for one item, stored as typed price and timestamp columns
+
+    Missing prices are stored as 0, matching how the rest of the bot already
+    treats falsy prices, and read back as None through indexing/iteration.
+    """
+
+    __slots__ = ("_prices", "_times", "_count", "_path", "_headers")
+
+    def __init__(self, capacity: int = 16):
+        self._prices: np.ndarray = np.zeros(max(1, capacity), dtype=np.int32)
+        self._times: np.ndarray = np.zeros(max(1, capacity), dtype=np.float64)
+        self._count: int = 0
+        self._path: str | None = None
+        self._headers: list[np.memmap] = []
+
+    @classmethod
+    def from_pairs(cls, pairs) -> PriceHistory:
+        pairs = list(pairs)
+        history = cls(capacity=len(pairs) + 16)
+        for price, sold_at in pairs:
+            history.append(price, sold_at)
+        return history
+
+    @classmethod
+    def open(cls, path: str, capacity: int = 1024) -> PriceHistory:
+        """ Memory-maps the history stored at `path`.prices / `path`.times, creating it if needed """
+        history = cls.__new__(cls)
+        history._path = path
+        history._count = 0
+
+        for suffix, dtype in ((".prices", np.int32), (".times", np.float64)):
+            if not os.path.exists(path + suffix):
+                with open(path + suffix, "wb") as f:
+                    f.write(MAGIC + np.int64(0).tobytes())
+                    f.truncate(HEADER_SIZE + capacity * np.dtype(dtype).itemsize)
+
+        history._map()
+        history._count = int(history._headers[0][0])
+        return history
+
+    def _map(self) -> None:
+        self._headers = []
+        columns = []
+        for suffix, dtype in ((".prices", np.int32), (".times", np.float64)):
+            path = self._path + suffix
+            capacity = (os.path.getsize(path) - HEADER_SIZE) // np.dtype(dtype).itemsize
+            self._headers.append(np.memmap(path, dtype=np.int64, mode="r+", offset=8, shape=(1,)))
+            columns.append(np.memmap(path, dtype=dtype, mode="r+", offset=HEADER_SIZE, shape=(capacity,)))
+        self._prices, self._times = columns
+
+    def _grow(self) -> None:
+        capacity = len(self._prices) * 2
+        if self._path is None:
+            self._prices = np.resize(self._prices, capacity)
+            self._times = np.resize(self._times, capacity)
+            return
+
+        self.flush()
+        for suffix, dtype in ((".prices", np.int32), (".times", np.float64)):
+            with open(self._path + suffix, "r+b") as f:
+                f.truncate(HEADER_SIZE + capacity * np.dtype(dtype).itemsize)
+        self._map()
+
+    def append(self, price: int | None, sold_at: float) -> None:
+        """ Adds one sale, in amortized O(1) """
+        if self._count == len(self._prices):
+            self._grow()
+
+        self._prices[self._count] = price or 0
+        self._times[self._count] = sold_at
+        self._count += 1
+
+        for header in self._headers:
+            header[0] = self._count
+
+    def clear(self) -> None:
+        self._count = 0
+        for header in self._headers:
+            header[0] = 0
+
+    def drop_before(self, cutoff: float, keep: int = 1) -> int:
+        """ Forgets sales older than `cutoff`, returning how many were dropped
+
+        The newest `keep` priced sales, and anything after them, are never
+        dropped (nor the newest sale, priced or not).
+        """
+        priced = np.flatnonzero(self.prices)
+        keep_from = int(priced[-keep]) if len(priced) >= keep else 0
+        dropped = min(int(np.searchsorted(self.times, cutoff, side="left")), keep_from, self._count - 1)
+        if dropped <= 0:
+            return 0
+
+        kept = self._count - dropped
+        self._prices[:kept] = self._prices[dropped:self._count]
+        self._times[:kept] = self._times[dropped:self._count]
+        self._count = kept
+        for header in self._headers:
+            header[0] = kept
+        return dropped
+
+    def flush(self) -> None:
+        for column in (self._prices, self._times, *self._headers):
+            if isinstance(column, np.memmap):
+                column.flush()
+
+    @property
+    def prices(self) -> np.ndarray:
+        """ View of every stored price, 0 where the price was missing """
+        return self._prices[:self._count]
+
+    @property
+    def times(self) -> np.ndarray:
+        """ View of every sale timestamp """
+        return self._times[:self._count]
+
+    def sales(self) -> tuple[np.ndarray, np.ndarray]:
+        """ Prices and timestamps of the sales that have a price """
+        prices = self.prices
+        mask = prices != 0
+        return prices[mask], self.times[mask]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> tuple[int | None, float]:
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("PriceHistory index out of range")
+
+        price = int(self._prices[index])
+        return (price or None, float(self._times[index]))
+
+    def __iter__(self):
+        for price, sold_at in zip(self.prices.tolist(), self.times.tolist()):
+            yield (price or None, sold_at)
@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import json
+import re
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:
+    json_loads = json.loads
+    json_dumps = lambda obj: json.dumps(obj).encode("utf-8")
+
+
+@dataclass(slots=True)
+class ItemDetails:
+    """ The tracked fields of one marketableItem block """
+    name: str | None = None
+    item_type: str | None = None
+    tags: list | None = None
+
+    lowest_buyer: int | None = None
+    highest_buyer: int | None = None
+    volume_buyers: int | None = None
+
+    lowest_seller: int | None = None
+    highest_seller: int | None = None
+    volume_sellers: int | None = None
+
+    last_sold: int | None = None
+    last_sold_at: float | None = None
+
+    asset_url: str | None = None
+
+    missing: tuple[str, ...] = ()
+    fingerprint: int | None = None
+
+    @property
+    def snapshot(self) -> list:
+        """ Buyers: LOW | HIGH | VOL - Sellers: LOW | HIGH | VOL """
+        return [
+            self.lowest_buyer, self.highest_buyer, self.volume_buyers,
+            self.lowest_seller, self.highest_seller, self.volume_sellers
+        ]
+
+
+@dataclass(slots=True)
+class Unchanged:
+    """ Stands in for an item whose marketData block matched the fingerprint we already had """
+    fingerprint: int
+
+
+# Where each field lives inside a marketableItem block
+SCHEMA: dict[str, tuple] = {
+    "name":           ("item", "name"),
+    "item_type":      ("item", "type"),
+    "tags":           ("item", "tags"),
+    "asset_url":      ("item", "assetUrl"),
+
+    "lowest_buyer":   ("marketData", "buyStats", 0, "lowestPrice"),
+    "highest_buyer":  ("marketData", "buyStats", 0, "highestPrice"),
+    "volume_buyers":  ("marketData", "buyStats", 0, "activeCount"),
+
+    "lowest_seller":  ("marketData", "sellStats", 0, "lowestPrice"),
+    "highest_seller": ("marketData", "sellStats", 0, "highestPrice"),
+    "volume_sellers": ("marketData", "sellStats", 0, "activeCount"),
+
+    "last_sold":      ("marketData", "lastSoldAt", 0, "price"),
+    "last_sold_at":   ("marketData", "lastSoldAt", 0, "performedAt"),
+}
+
+
+def _compile(schema: dict[str, tuple]) -> dict:
+    """ Folds the field paths into one tree so shared prefixes are only walked once """
+    tree = {}
+    for field, path in schema.items():
+        node = tree
+        for step in path[:-1]:
+            node = node.setdefault(step, {})
+        node[path[-1]] = field
+    return tree
+
+def _leaves(tree: dict | str):
+    if isinstance(tree, str):
+        yield tree
+    else:
+        for sub in tree.values():
+            yield from _leaves(sub)
+
+def _walk(node, tree: dict, values: dict, missing: list) -> None:
+    for step, sub in tree.items():
+        try:
+            child = node[step]
+        except (KeyError, IndexError, TypeError):
+            missing.extend(_leaves(sub))
+            continue
+
+        if isinstance(sub, str):
+            values[sub] = child
+        else:
+            _walk(child, sub, values, missing)
+
+COMPILED_SCHEMA = _compile(SCHEMA)
+
+
+# Ubisoft stamps look like "2024-01-01T00:00:00.1234567Z"; before Python 3.11,
+# fromisoformat() accepts neither the Z nor more than 6 fraction digits
+ISO_STAMP = re.compile(r"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)?")
+
+def _timestamp(performed_at: str | None) -> float | None:
+    match = ISO_STAMP.fullmatch(performed_at) if isinstance(performed_at, str) else None
+    if match is None:
+        return None
+    stamp, fraction, zone = match.groups()
+    if fraction:
+        stamp += "." + fraction[:6].ljust(6, "0")
+    try:
+        return datetime.fromisoformat(stamp + (zone if zone and zone != "Z" else "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+def fingerprint(block: dict | None) -> int | None:
+    """ Cheap checksum of a marketableItem's marketData, None if it has none """
+    market_data = block.get("marketData") if isinstance(block, dict) else None
+    if market_data is None:
+        return None
+    return zlib.crc32(json_dumps(market_data))
+
+
+def parse_marketable_item(block: dict | None, known: int = None) -> ItemDetails | Unchanged:
+    """ Extracts every tracked field from a marketableItem block in a single walk
+
+    If the block's marketData fingerprint equals `known`, nothing is
+    extracted and Unchanged is returned instead.
+    """
+    checksum = fingerprint(block)
+    if checksum is not None and checksum == known:
+        return Unchanged(checksum)
+
+    values = {}
+    missing = []
+    _walk(block, COMPILED_SCHEMA, values, missing)
+    if "last_sold_at" in values:
+        values["last_sold_at"] = _timestamp(values["last_sold_at"])
+    return ItemDetails(**values, missing=tuple(missing), fingerprint=checksum)
+
+def parse_item_details(res: dict, known: int = None) -> ItemDetails | Unchanged:
+    """ Extracts the tracked fields from a whole GetItemDetails response """
+    try:
+        block = res["data"]["game"]["marketableItem"]
+    except (KeyError, TypeError):
+        block = None
+    return parse_marketable_item(block, known)
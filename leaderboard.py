@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import time
+
+import numpy as np
+
+# Windows `econ top` can rank over, in seconds
+WINDOWS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+METRICS = ("change", "spread", "volume")
+
+
+class Leaderboard:
+    """ Cross-item rankings, served from one NumPy matrix rebuilt after each scan pass
+
+    Each row is a tracked item. Columns hold the latest order-book snapshot,
+    the last sale price and, for every window, the reference price at the
+    start of the window and the number of sales inside it. Missing values are
+    NaN so they sort last and never win a ranking.
+    """
+
+    def __init__(self):
+        self.item_ids: np.ndarray = np.array([], dtype=object)
+        self.snapshots: np.ndarray = np.empty((0, 6))
+        self.last_price: np.ndarray = np.empty(0)
+        self.start_price: np.ndarray = np.empty((0, len(WINDOWS)))
+        self.volume: np.ndarray = np.empty((0, len(WINDOWS)))
+        self.built_at: float | None = None
+
+    def rebuild(self, data: dict, now: float = None) -> None:
+        """ Recomputes the matrix from the in-memory market state """
+        now = time.time() if now is None else now
+        count = len(data)
+        cutoffs = now - np.array(list(WINDOWS.values()), dtype=np.float64)
+
+        item_ids = np.empty(count, dtype=object)
+        snapshots = np.full((count, 6), np.nan)
+        last_price = np.full(count, np.nan)
+        start_price = np.full((count, len(WINDOWS)), np.nan)
+        volume = np.zeros((count, len(WINDOWS)))
+
+        for row, (item_id, item) in enumerate(data.items()):
+            item_ids[row] = item_id
+            if item["data"] is not None:
+                snapshots[row] = [np.nan if value is None else value for value in item["data"]]
+
+            prices, times = item["sold"].sales()
+            if not len(prices):
+                continue
+            last_price[row] = prices[-1]
+
+            # First sale inside each window; the sale before it is the reference price
+            starts = np.searchsorted(times, cutoffs, side="left")
+            volume[row] = len(times) - starts
+            start_price[row] = prices[np.maximum(starts - 1, 0)]
+
+        self.item_ids = item_ids
+        self.snapshots = snapshots
+        self.last_price = last_price
+        self.start_price = start_price
+        self.volume = volume
+        self.built_at = now
+
+    def column(self, metric: str, window: str = "day") -> np.ndarray:
+        """ Per-item values of one ranking metric """
+        match metric:
+            case "change":
+                start = self.start_price[:, list(WINDOWS).index(window)]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    return (self.last_price - start) / start * 100
+            case "spread":
+                return self.snapshots[:, 3] - self.snapshots[:, 1]
+            case "volume":
+                return self.volume[:, list(WINDOWS).index(window)]
+        raise KeyError(metric)
+
+    def top(self, metric: str, window: str = "day", limit: int = 10) -> list[tuple[str, float]]:
+        """ The `limit` items with the largest value of `metric`, largest first
+
+        Price changes are ranked by magnitude, so big drops rank next to big gains.
+        """
+        values = self.column(metric, window)
+        keys = np.abs(values) if metric == "change" else values
+        keys = np.where(np.isnan(keys), -np.inf, keys)
+
+        limit = min(limit, len(keys))
+        if limit == 0:
+            return []
+        best = np.argpartition(-keys, limit - 1)[:limit]
+        best = best[np.argsort(-keys[best], kind="stable")]
+        return [(self.item_ids[row], float(values[row])) for row in best if keys[row] != -np.inf]
+
+    def __len__(self) -> int:
+        return len(self.item_ids)
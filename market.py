@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Callable
+
+from history import PriceHistory
+from item_details import ItemDetails, Unchanged
+from stats import ItemStats, MarketStats
+from store import MIN_RAW_SALES, MarketStore
+
+
+class Market:
+    """ In-memory market state, kept in step with the store as scan results are ingested """
+
+    def __init__(
+            self,
+            store: MarketStore,
+            data: dict = None,
+            stats: MarketStats = None,
+            verbose: bool = True,
+            lazy: bool = False,
+            history_dir: str = None,
+    ):
+        self.store: MarketStore = store
+        self.data: dict = data if data is not None else store.load(history_dir=history_dir, lazy=lazy)
+        self.totals: dict[str, tuple[int, int]] = store.sale_totals()
+        self.stats: MarketStats = stats or MarketStats.from_data(self.data, self.totals)
+        self.verbose: bool = verbose
+        self.history_dir: str | None = history_dir
+
+        # marketData fingerprint of the last result ingested per item, so rescans of quiet items skip parsing
+        self.fingerprints: dict[str, int] = {}
+
+        # Items whose sale history hasn't been read from the store yet
+        self.unloaded: set[str] = set(self.data) if lazy else set()
+
+        # Called with the item id whenever an item's snapshot or sales change
+        self.listeners: list[Callable[[str], None]] = []
+        # What the ingest being reported to listeners changed: "snapshot" (and "lowest_seller") and/or "sale"
+        self.last_changes: set[str] = set()
+
+    def _log(self, msg: str) -> None:
+        if self.verbose:
+            print(msg)
+
+    def ensure_loaded(self, item_id: str) -> None:
+        """ Reads an item's sale history now if it was deferred """
+        if item_id not in self.unloaded:
+            return
+        self.unloaded.discard(item_id)
+
+        history = self.store.load_history(item_id, self.history_dir)
+        self.data[item_id]["sold"] = history
+        self.stats.items[item_id] = ItemStats.from_history(history)
+        if item_id in self.totals:
+            self.stats.items[item_id].total, self.stats.items[item_id].count = self.totals[item_id]
+
+    async def load_remaining(self, batch_size: int = 50) -> None:
+        """ Reads every deferred history, yielding to the event loop between batches """
+        start = time.perf_counter()
+        count = len(self.unloaded)
+        while self.unloaded:
+            for item_id in list(self.unloaded)[:batch_size]:
+                self.ensure_loaded(item_id)
+            await asyncio.sleep(0)
+        if count:
+            self._log(f'[ Loaded the history of {count} items in {time.perf_counter() - start:.2f}s ]')
+
+    def ingest(self, item_id: str, res: ItemDetails, now: float = None) -> bool:
+        """ Folds one item's scan result into memory and the store, returning whether it changed """
+        now = now or time.time()
+        self.ensure_loaded(item_id)
+        data = self.data
+        changes = set()
+
+        if res.missing:
+            self._log(f'[ - - Missing fields: {", ".join(res.missing)} ]')
+
+        # Meta: NAME | TYPE | TAGS - Buyers: LOW | HIGH | VOL - Sellers: LOW | HIGH | VOL
+        try:
+            data[item_id]
+        except:
+            data[item_id] = {
+                "name": res.name,
+                "type": res.item_type,
+                "tags": res.tags,
+                "asset_url": res.asset_url,
+                "sold": PriceHistory(),
+                "data": None
+            }
+            self.store.add_item(item_id, res.name, res.item_type, res.tags, res.asset_url)
+        snapshot = res.snapshot
+        previous = data[item_id]["data"]
+        if previous == None or previous != snapshot:
+            data[item_id]["data"] = snapshot
+            self.store.append_snapshot(item_id, now, snapshot)
+            changes.add("snapshot")
+            if previous is None or previous[3] != snapshot[3]:
+                changes.add("lowest_seller")
+            self._log('[ - - NEW PRIMARY DATA ]')
+
+        # Sales are told apart by when they happened, so repeat sales at the same price still count.
+        # Sales recorded before performedAt was tracked carry the (later) time they were first seen.
+        sold = data[item_id]["sold"]
+        if res.last_sold_at is not None:
+            sold_at = res.last_sold_at
+            new_sale = len(sold) == 0 or sold_at > sold[-1][1]
+        else:
+            sold_at = now
+            new_sale = len(sold) == 0 or sold[-1][0] != res.last_sold
+        if new_sale:
+            sold.append(res.last_sold, sold_at)
+            self.store.append_sale(item_id, res.last_sold, sold_at)
+            self.stats.add_sale(item_id, res.last_sold)
+            changes.add("sale")
+            self._log('[ - - NEW LAST SOLD ]')
+
+        if res.fingerprint is not None:
+            self.fingerprints[item_id] = res.fingerprint
+
+        if changes:
+            self.last_changes = changes
+            for listener in self.listeners:
+                listener(item_id)
+        return bool(changes)
+
+    def compact(self, max_age: float, now: float = None) -> int:
+        """ Moves raw sales older than `max_age` seconds out of memory and the store
+
+        They stay represented in the store's OHLC rollups, which back the
+        all-time statistics and long-window graphs.
+        """
+        cutoff = (now or time.time()) - max_age
+        self.store.commit()
+        dropped = self.store.compact_sales(cutoff)
+        for item_id, item in self.data.items():
+            # Deferred histories will be read after the compaction anyway
+            if item_id not in self.unloaded:
+                item["sold"].drop_before(cutoff, keep=MIN_RAW_SALES)
+        return dropped
+
+    async def scan(self, scanner, items: dict[str, str], on_result: Callable[[str, bool | None], None] = None) -> int:
+        """ Runs one scanner pass over `items`, ingesting results as they arrive
+
+        Everything learned during the pass is committed together at the end.
+        `on_result` is called with each item id and whether it changed, or
+        None if it could not be fetched. Returns the number of items that changed.
+        """
+        changed = 0
+        async for key, item_id, res in scanner.scan(items, self.fingerprints):
+            self._log(f'[ - [ Scanning {key} ] ]')
+
+            if isinstance(res, Unchanged):
+                if on_result:
+                    on_result(item_id, False)
+                continue
+
+            if (not isinstance(res, ItemDetails)):
+                self._log("Rate Limited!")
+                if on_result:
+                    on_result(item_id, None)
+                continue
+
+            item_changed = self.ingest(item_id, res)
+            changed += item_changed
+            if on_result:
+                on_result(item_id, item_changed)
+            self._log(f'[ ~ [ Done checking {key} ] ]')
+
+        self.store.commit()
+        return changed
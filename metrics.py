@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import bisect
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from aiohttp import web
+
+
+class Metric:
+    """ Base for metrics rendered in the Prometheus text exposition format """
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name: str = name
+        self.help: str = help
+        self.labels: tuple[str, ...] = labels
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, key: tuple, extra: dict = None) -> str:
+        pairs = list(zip(self.labels, key)) + list((extra or {}).items())
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: dict[tuple, float] = defaultdict(float)
+        if not self.labels:
+            self.values[()] = 0
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        self.values[self._key(labels)] += amount
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{self._format_labels(key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+    def __init__(self, *args, buckets: tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets: tuple[float, ...] = tuple(sorted(buckets))
+        self.counts: dict[tuple, list[int]] = {}
+        self.sums: dict[tuple, float] = defaultdict(float)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        if key not in self.counts:
+            self.counts[key] = [0] * (len(self.buckets) + 1)
+        self.counts[key][bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        for key, counts in self.counts.items():
+            total = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                total += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{self._format_labels(key, {'le': le})} {total}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {self.sums[key]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {total}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REGISTRY: list[Metric] = []
+
+def render() -> str:
+    """ Every registered metric in the Prometheus text format """
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def take_deltas() -> dict[str, object]:
+    """ Counter and histogram values recorded since the last call, which are then reset
+
+    Lets a worker process hand what it recorded to its parent, which adds
+    them into its own metrics with merge_deltas(). Gauges are left out.
+    """
+    deltas = {}
+    for metric in REGISTRY:
+        if isinstance(metric, Histogram):
+            if metric.counts:
+                deltas[metric.name] = (metric.counts, dict(metric.sums))
+                metric.counts = {}
+                metric.sums = defaultdict(float)
+        elif isinstance(metric, Counter) and not isinstance(metric, Gauge):
+            values = {key: value for key, value in metric.values.items() if value}
+            if values:
+                deltas[metric.name] = values
+                for key in values:
+                    metric.values[key] = 0
+    return deltas
+
+def merge_deltas(deltas: dict[str, object]) -> None:
+    """ Adds values from another process's take_deltas() into this process's metrics """
+    metrics = {metric.name: metric for metric in REGISTRY}
+    for name, values in deltas.items():
+        metric = metrics.get(name)
+        if isinstance(metric, Histogram):
+            counts, sums = values
+            for key, bucket_counts in counts.items():
+                mine = metric.counts.setdefault(key, [0] * (len(metric.buckets) + 1))
+                for i, count in enumerate(bucket_counts):
+                    mine[i] += count
+                metric.sums[key] += sums[key]
+        elif isinstance(metric, Counter):
+            for key, value in values.items():
+                metric.values[key] += value
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+async def start_server(host: str = "127.0.0.1", port: int = 9464) -> web.AppRunner:
+    """ Serves /metrics on the running event loop """
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    print(f"[ Serving metrics on http://{host}:{port}/metrics ]")
+    return runner
+
+
+SCAN_PASS_SECONDS = Histogram("r6econ_scan_pass_seconds", "Wall-clock duration of each market scan pass")
+SCAN_LAST_PASS_SECONDS = Gauge("r6econ_scan_last_pass_seconds", "Duration of the most recent market scan pass")
+SCAN_INTERVAL_SECONDS = Gauge("r6econ_scan_interval_seconds", "Configured interval between scan ticks")
+SCAN_OVERRUNS = Counter("r6econ_scan_overruns_total", "Scan passes that took longer than the scan tick")
+SCAN_ITEMS = Counter("r6econ_scan_items_total", "Items scanned, by outcome", labels=("outcome",))
+
+UBISOFT_REQUEST_SECONDS = Histogram("r6econ_ubisoft_request_seconds", "Latency of Ubisoft GraphQL requests", labels=("operation",))
+UBISOFT_UNAUTHORIZED = Counter("r6econ_ubisoft_unauthorized_total", "Ubisoft responses rejecting our ticket with a 401")
+UBISOFT_GRAPHQL_ERRORS = Counter("r6econ_ubisoft_graphql_errors_total", "Entries in the errors list of GraphQL responses")
+UBISOFT_LOGINS = Counter("r6econ_ubisoft_logins_total", "Ticket requests sent to the Ubisoft login endpoint", labels=("ticket",))
+
+HTTP_CONNECTIONS_CREATED = Counter("r6econ_http_connections_created_total", "New connections opened by the Ubisoft connection pool")
+HTTP_CONNECTIONS_REUSED = Counter("r6econ_http_connections_reused_total", "Requests served over an already open, kept-alive connection")
+HTTP_CONNECTIONS_OPEN = Gauge("r6econ_http_connections_open", "Connections held by the Ubisoft connection pool, by state", labels=("state",))
+HTTP_CONNECTION_REUSE_RATIO = Gauge("r6econ_http_connection_reuse_ratio", "Share of connections handed out that were reused")
+HTTP_POOL_RECYCLES = Counter("r6econ_http_pool_recycles_total", "Times the connection pool was replaced after a connection error")
+
+EVENT_LOOP_LAG = Histogram("r6econ_event_loop_lag_seconds", "How late the event loop woke a sleeping watchdog", buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+EVENT_LOOP_BLOCKS = Counter("r6econ_event_loop_blocks_total", "Times a callback blocked the event loop past the watchdog threshold")
+
+COMMAND_SECONDS = Histogram("r6econ_command_seconds", "Time spent handling each bot command", labels=("command",))
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+
+import aiohttp
+
+from metrics import HTTP_CONNECTIONS_CREATED, HTTP_CONNECTIONS_REUSED, HTTP_POOL_RECYCLES
+
+
+class ConnectionPool:
+    """ One long-lived aiohttp session shared by every request to Ubisoft
+
+    Connections are kept alive between requests and scan passes, with DNS
+    results cached, so TLS handshakes only happen when a connection is
+    actually new. The session is only replaced after a connection error;
+    the old one is closed after `grace` seconds so requests already running
+    on it can finish.
+    """
+
+    def __init__(
+            self,
+            limit: int = 100,
+            limit_per_host: int = 32,
+            dns_ttl: int = 300,
+            keepalive: float = 60,
+            grace: float = 30,
+            session: aiohttp.ClientSession = None,
+            trace_configs: list[aiohttp.TraceConfig] = None,
+    ):
+        self.limit: int = limit
+        self.limit_per_host: int = limit_per_host
+        self.dns_ttl: int = dns_ttl
+        self.keepalive: float = keepalive
+        self.grace: float = grace
+        self.trace_configs: list[aiohttp.TraceConfig] = trace_configs or []
+
+        self._session: aiohttp.ClientSession | None = session
+        self._adopted: bool = session is not None
+
+        self.created: int = 0
+        self.reused: int = 0
+        self.recycles: int = 0
+
+    def _trace(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_create(session, ctx, params):
+            self.created += 1
+            HTTP_CONNECTIONS_CREATED.inc()
+        async def on_reuse(session, ctx, params):
+            self.reused += 1
+            HTTP_CONNECTIONS_REUSED.inc()
+
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+    def session(self) -> aiohttp.ClientSession:
+        """ The current session, opened on first use so it binds to the running loop """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.dns_ttl,
+                use_dns_cache=True,
+                keepalive_timeout=self.keepalive,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, trace_configs=[self._trace(), *self.trace_configs])
+            self._adopted = False
+        return self._session
+
+    def recycle(self, failed: aiohttp.ClientSession = None) -> None:
+        """ Swaps in a fresh session after a connection error on `failed`
+
+        Errors from a session that has already been replaced are ignored, so
+        a burst of failures from one outage only recycles the pool once.
+        """
+        old = self._session
+        if old is None or (failed is not None and failed is not old) or self._adopted:
+            return
+
+        self._session = None
+        self.recycles += 1
+        HTTP_POOL_RECYCLES.inc()
+        print("[ Recycling the HTTP connection pool after a connection error ]")
+        asyncio.get_running_loop().call_later(self.grace, lambda: asyncio.ensure_future(old.close()))
+
+    def stats(self) -> dict:
+        """ Connection counts, plus the share of requests that reused a kept-alive connection """
+        connector = self._session.connector if self._session is not None else None
+        in_use = len(getattr(connector, "_acquired", ()))
+        idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+
+        return {
+            "open": in_use + idle,
+            "in_use": in_use,
+            "idle": idle,
+            "created": self.created,
+            "reused": self.reused,
+            "reuse_ratio": self.reused / max(1, self.created + self.reused),
+            "recycles": self.recycles,
+        }
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from metrics import EVENT_LOOP_BLOCKS, EVENT_LOOP_LAG
+
+
+class LoopWatchdog:
+    """ Measures event loop lag and reports whatever is blocking the loop
+
+    A coroutine on the loop bumps a heartbeat every `interval` seconds and
+    records how late each wakeup was. A separate thread watches that
+    heartbeat; once it is older than `threshold`, the loop thread's current
+    stack is printed, once per stall, while the culprit is still running.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05):
+        self.threshold: float = threshold
+        self.interval: float = interval
+        self.heartbeat: float = time.monotonic()
+        self.loop_thread: int | None = None
+        self._task: asyncio.Task | None = None
+        self._stopped: threading.Event = threading.Event()
+
+    def start(self) -> None:
+        self.loop_thread = threading.get_ident()
+        self.heartbeat = time.monotonic()
+        self._task = asyncio.ensure_future(self._beat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _beat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            EVENT_LOOP_LAG.observe(max(0.0, now - expected))
+            self.heartbeat = now
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stopped.wait(self.interval):
+            heartbeat = self.heartbeat
+            if time.monotonic() - heartbeat < self.threshold or reported == heartbeat:
+                continue
+            reported = heartbeat
+
+            frame = sys._current_frames().get(self.loop_thread)
+            if frame is None:
+                continue
+            EVENT_LOOP_BLOCKS.inc()
+            stack = "".join(traceback.format_stack(frame))
+            print(f'[ Event loop blocked for over {self.threshold}s, currently at: ]\n{stack}', flush=True)
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+def sample_profile(duration: float, rate: float = 100, thread_id: int = None) -> str:
+    """ Samples every thread's stack (or one thread's) `rate` times a second for `duration` seconds
+
+    Returns the samples as collapsed stacks, one "root;...;leaf count" line
+    per distinct stack, ready for flamegraph.pl or speedscope. Must run in
+    its own thread so the code being profiled keeps running.
+    """
+    me = threading.get_ident()
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    samples = Counter()
+
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me or (thread_id is not None and ident != thread_id):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            samples[";".join(reversed(stack))] += 1
+        time.sleep(1 / rate)
+
+    return "".join(f'{stack} {count}\n' for stack, count in samples.most_common())
@@ -0,0 +1,70 @@
+""" Rebuilds a market database from captured GraphQL responses
+
+Segments written with CAPTURE_DIR are decompressed and parsed on every core,
+then ingested in capture order by a single writer, exactly as if the scans
+were happening live:
+
+    python replay.py assets/capture --db assets/replayed.db --workers 8
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from capture import parse_segment, segments
+from market import Market
+from store import MarketStore
+
+
+def replay(directory: str, db_path: str, workers: int = None, partial: bool = False) -> tuple[int, int]:
+    """ Ingests every captured item result into the store at `db_path`, returning (results, changes) """
+    paths = segments(directory, partial=partial)
+    market = Market(MarketStore(db_path), verbose=False)
+
+    results = 0
+    changes = 0
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Only a couple of segments per worker are parsed ahead of the ingest,
+        # so memory stays flat however long the capture is
+        remaining = iter(paths)
+        pending = deque((path, pool.submit(parse_segment, path)) for path in itertools.islice(remaining, 2 * workers))
+        while pending:
+            path, future = pending.popleft()
+            parsed = future.result()
+            for next_path in itertools.islice(remaining, 1):
+                pending.append((next_path, pool.submit(parse_segment, next_path)))
+
+            for captured_at, item_id, res in parsed:
+                changes += market.ingest(item_id, res, now=captured_at)
+            results += len(parsed)
+            market.store.commit()
+            print(f'[ Replayed {os.path.basename(path)}: {len(parsed)} results ]')
+
+    market.store.close()
+    return results, changes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="capture directory to replay")
+    parser.add_argument("--db", required=True, help="market database to ingest into, normally a fresh one")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="segment parsing processes")
+    parser.add_argument("--partial", action="store_true", help="also replay segments that were never closed, e.g. after a crash")
+    args = parser.parse_args()
+
+    if os.path.abspath(args.db) == os.path.abspath("assets/market.db"):
+        parser.error("refusing to replay into the live database")
+
+    start = time.perf_counter()
+    results, changes = replay(args.directory, args.db, args.workers, args.partial)
+    print(f'[ Replayed {results} results ({changes} changes) in {time.perf_counter() - start:.2f}s ]')
+
+
+if __name__ == "__main__":
+    main()
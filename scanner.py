@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import time
+import asyncio
+
+from item_details import ItemDetails, Unchanged
+
+
+class TokenBucket:
+    """ Spends a shared request budget, refilling at a fixed rate """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate: float = rate
+        self.capacity: int = max(1, capacity)
+        self.tokens: float = self.capacity
+        self._updated: float = time.monotonic()
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """ Waits until enough tokens are available, then spends them """
+        async with self._lock:
+            self._refill()
+            while self.tokens < tokens:
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= tokens
+
+
+class MarketScanner:
+    """ Queries many items at once, capped by concurrency and a request budget """
+
+    def __init__(
+            self,
+            auth,
+            concurrency: int = 8,
+            rate: float = 12.5,
+            burst: int = None,
+            batch_size: int = 1,
+    ):
+        self.auth = auth
+        self.concurrency: int = max(1, concurrency)
+        self.batch_size: int = max(1, batch_size)
+        self.bucket: TokenBucket = TokenBucket(rate, burst or self.concurrency)
+
+        self.last_pass_duration: float = 0.0
+        self.last_pass_items: int = 0
+        self.last_pass_failures: int = 0
+
+    async def _query(self, semaphore: asyncio.Semaphore, key: str, item_id: str, known: dict[str, int]) -> tuple[str, str, ItemDetails | Unchanged | int | None]:
+        async with semaphore:
+            await self.bucket.acquire()
+            try:
+                res = await self.auth.try_query_db(item_id, known.get(item_id))
+            except Exception as e:
+                print(f'[ - [ Failed to scan {key}: "{e}" ] ]')
+                res = None
+            return key, item_id, res
+
+    async def _query_batch(self, semaphore: asyncio.Semaphore, batch: list[tuple[str, str]], known: dict[str, int]) -> list[tuple[str, str, ItemDetails | Unchanged | int | None]]:
+        async with semaphore:
+            await self.bucket.acquire()
+            try:
+                results = await self.auth.try_query_db_batch([item_id for _, item_id in batch], known)
+            except Exception as e:
+                print(f'[ - [ Failed to scan batch of {len(batch)}: "{e}" ] ]')
+                results = -1
+
+        # A batch that failed outright is most likely rate limited, so only
+        # items missing from an otherwise good response are retried one by one
+        if not isinstance(results, dict):
+            return [(key, item_id, results) for key, item_id in batch]
+
+        missing = [(key, item_id) for key, item_id in batch if item_id not in results]
+        retried = await asyncio.gather(*(self._query(semaphore, key, item_id, known) for key, item_id in missing))
+
+        return [(key, item_id, results[item_id]) for key, item_id in batch if item_id in results] + list(retried)
+
+    async def scan(self, item_ids: dict[str, str], known: dict[str, int] = None):
+        """ Yields (name, item id, result) for each item as soon as its request finishes
+
+        Items whose marketData fingerprint matches `known` come back as Unchanged.
+        """
+        known = known or {}
+        start = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        items = list(item_ids.items())
+
+        if self.batch_size > 1:
+            tasks = [
+                asyncio.ensure_future(self._query_batch(semaphore, items[i:i + self.batch_size], known))
+                for i in range(0, len(items), self.batch_size)
+            ]
+        else:
+            tasks = [
+                asyncio.ensure_future(self._query(semaphore, key, item_id, known))
+                for key, item_id in items
+            ]
+
+        failures = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                done = await next_done
+                for key, item_id, res in (done if self.batch_size > 1 else [done]):
+                    if not isinstance(res, (ItemDetails, Unchanged)):
+                        failures += 1
+                    yield key, item_id, res
+        finally:
+            for task in tasks:
+                task.cancel()
+
+            self.last_pass_duration = time.perf_counter() - start
+            self.last_pass_items = len(items)
+            self.last_pass_failures = failures
@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import time
+
+import numpy as np
+
+
+class PollScheduler:
+    """ Decides when each item is next polled, based on how often and how wildly it trades
+
+    Items sit in a heap ordered by their next poll time. An item's interval
+    starts from half its recent mean gap between sales, shrunk further when
+    its recent prices are volatile, and is clamped to [min_interval,
+    max_interval]. Because sales are only seen when we poll, an item that
+    just changed has its interval halved, and a quiet one may at most double
+    its interval per poll, so estimates recover from being polled too slowly.
+    """
+
+    def __init__(
+            self,
+            min_interval: float = 30,
+            max_interval: float = 300,
+            volatility_weight: float = 10.0,
+            window: int = 20,
+    ):
+        self.min_interval: float = min_interval
+        self.max_interval: float = max_interval
+        self.volatility_weight: float = volatility_weight
+        self.window: int = window
+
+        self._heap: list[tuple[float, int, str]] = []
+        self._counter = itertools.count()
+        self.entries: dict[str, dict] = {}
+
+    def sync(self, item_ids: dict[str, str], now: float = None) -> None:
+        """ Adds newly tracked items (due immediately) and forgets untracked ones """
+        now = time.time() if now is None else now
+        tracked = set(item_ids.values())
+
+        for item_id in list(self.entries):
+            if item_id not in tracked:
+                del self.entries[item_id]
+
+        for key, item_id in item_ids.items():
+            if item_id not in self.entries:
+                self.entries[item_id] = {"key": key, "interval": self.min_interval, "next_at": now}
+                heapq.heappush(self._heap, (now, next(self._counter), item_id))
+
+    def interval_for(self, history) -> float:
+        """ Polling interval suggested by an item's recent sales """
+        prices, times = history.sales() if history is not None else ((), ())
+        prices, times = prices[-self.window:], times[-self.window:]
+        if len(times) < 2:
+            return self.max_interval
+
+        mean_gap = (times[-1] - times[0]) / (len(times) - 1)
+        mean_price = float(np.mean(prices))
+        volatility = float(np.std(prices)) / mean_price if mean_price else 0.0
+
+        interval = mean_gap / 2 / (1 + self.volatility_weight * volatility)
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def reschedule(self, item_id: str, history, changed: bool | None, now: float = None) -> None:
+        """ Queues an item's next poll after a result; `changed` is None if the poll failed """
+        entry = self.entries.get(item_id)
+        if entry is None:
+            return
+        now = time.time() if now is None else now
+
+        previous = entry["interval"]
+        if changed is None:
+            interval = previous
+        elif changed:
+            interval = min(self.interval_for(history), previous / 2)
+        else:
+            interval = min(self.interval_for(history), previous * 2)
+        interval = min(self.max_interval, max(self.min_interval, interval))
+
+        entry["interval"] = interval
+        entry["next_at"] = now + interval
+        heapq.heappush(self._heap, (entry["next_at"], next(self._counter), item_id))
+
+    def due(self, limit: int, now: float = None) -> dict[str, str]:
+        """ Pops up to `limit` items whose poll time has passed, most overdue first """
+        now = time.time() if now is None else now
+        due = {}
+        popped = set()
+        while self._heap and len(due) < limit and self._heap[0][0] <= now:
+            next_at, _, item_id = heapq.heappop(self._heap)
+
+            # Stale heap entries are skipped rather than removed eagerly
+            entry = self.entries.get(item_id)
+            if entry is None or entry["next_at"] != next_at or item_id in popped:
+                continue
+            popped.add(item_id)
+            due[entry["key"]] = item_id
+        return due
+
+    def __len__(self) -> int:
+        return len(self.entries)
@@ -1,464 +1,33 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
-
 import time
 from urllib import parse
-import aiohttp
-import base64
-import time
 import json
-import copy
+import io
 import contextlib
 import os
 import asyncio
+import signal
 import discord
-import websockets
 from discord.ext import commands, tasks
 from os.path import exists
 
-import matplotlib.pyplot as plt
-import numpy as np
-from math import sin, cos, radians
-
-class FailedToConnect(Exception):
-    pass
-class InvalidRequest(Exception):
-    def __init__(self, *args, code=0, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.code = code
-class InvalidAttributeCombination(Exception):
-    pass
-
-
-class Auth:
-    """ Holds the authentication information """
-
-    @staticmethod
-    def get_basic_token(email: str, password: str) -> str:
-        return base64.b64encode(f"{email}:{password}".encode("utf-8")).decode("utf-8")
-
-    def __init__(
-            self,
-            email: str = None,
-            password: str = None,
-            token: str = None,
-            appid: str = None,
-            creds_path: str = None,
-            cachetime: int = 120,
-            max_connect_retries: int = 1,
-            session: aiohttp.ClientSession = None,
-            refresh_session_period: int = 180,
-            item_id: str = "",
-    ):
-        print("[ - Generating session data... ]")
-        self.session: aiohttp.ClientSession = session or aiohttp.ClientSession()
-        self.max_connect_retries: int = max_connect_retries
-        self.refresh_session_period: int = refresh_session_period
-
-        print("[ - Generating token data... ]")
-        self.token: str = token or Auth.get_basic_token(email, password)
-        self.creds_path: str = creds_path or f"{os.getcwd()}/creds/{self.token}.json"
-        self.appid: str = appid or 'e3d5ea9e-50bd-43b7-88bf-39794f4e3d40'
-        self.sessionid: str = ""
-        self.key: str = ""
-        self.new_key: str = ""
-        self.spaceid: str = ""
-        self.spaceids: dict[str: str] = {
-            "uplay": "0d2ae42d-4c27-4cb7-af6c-2099062302bb",
-            "psn": "0d2ae42d-4c27-4cb7-af6c-2099062302bb",
-            "xbl": "0d2ae42d-4c27-4cb7-af6c-2099062302bb"
-        }
-        self.profileid: str = ""
-        self.userid: str = ""
-        self.expiration: str = ""
-        self.new_expiration: str = ""
-
-        print("[ - Generating cache data... ]")
-        self.cachetime: int = cachetime
-        self.cache = {}
-
-        print("[ - Generating time data... ]")
-        self._login_cooldown: int = 0
-        self._session_start: float = time.time()
-
-    async def _ensure_session_valid(self) -> None:
-        if not self.session:
-            await self.refresh_session()
-        elif 0 <= self.refresh_session_period <= (time.time() - self._session_start):
-            await self.refresh_session()
-
-    async def refresh_session(self) -> None:
-        """ Closes the current session and opens a new one """
-        if self.session:
-            try:
-                await self.session.close()
-            except:
-                pass
-
-        self.session = aiohttp.ClientSession()
-        self._session_start = time.time()
-
-    async def get_session(self) -> aiohttp.ClientSession:
-        """ Retrieves the current session, ensuring it's valid first """
-        await self._ensure_session_valid()
-        return self.session
-
-    def save_creds(self) -> None:
-        """ Saves the credentials to a file """
-
-        if not os.path.exists(os.path.dirname(self.creds_path)):
-            os.makedirs(os.path.dirname(self.creds_path))
-
-        if not os.path.exists(self.creds_path):
-            with open(self.creds_path, 'w') as f:
-                json.dump({}, f)
-
-        # write to file, overwriting the old one
-        with open(self.creds_path, 'w') as f:
-            json.dump({
-                "sessionid": self.sessionid,
-                "key": self.key,
-                "new_key": self.new_key,
-                "spaceid": self.spaceid,
-                "profileid": self.profileid,
-                "userid": self.userid,
-                "expiration": self.expiration,
-                "new_expiration": self.new_expiration,
-            }, f, indent=4)
-
-    def load_creds(self) -> None:
-        """ Loads the credentials from a file """
-
-        if not os.path.exists(self.creds_path):
-            return
-
-        with open(self.creds_path, "r") as f:
-            data = json.load(f)
-
-        self.sessionid = data.get("sessionid", "")
-        self.key = data.get("key", "")
-        self.new_key = data.get("new_key", "")
-        self.spaceid = data.get("spaceid", "")
-        self.profileid = data.get("profileid", "")
-        self.userid = data.get("userid", "")
-        self.expiration = data.get("expiration", "")
-        self.new_expiration = data.get("new_expiration", "")
-
-        self._login_cooldown = 0
-
-    async def connect(self, _new: bool = False) -> None:
-        """ Connect to Ubisoft, automatically called when needed """
-        self.load_creds()
-
-        if self._login_cooldown > time.time():
-            raise FailedToConnect("Login on cooldown")
-
-        # If keys are still valid, don't connect again
-        if _new:
-            if self.new_key and datetime.fromisoformat(self.new_expiration[:26]+"+00:00") > datetime.now(timezone.utc):
-                return
-        else:
-            if self.key and datetime.fromisoformat(self.expiration[:26]+"+00:00") > datetime.now(timezone.utc):
-                print("[ Outdated key detected, re-authenticating... ]")
-                
-                await self.connect(_new=True)
-                return
-
-        session = await self.get_session()
-        headers = {
-            "User-Agent": "UbiServices_SDK_2020.Release.58_PC64_ansi_static",
-            "Content-Type": "application/json; charset=UTF-8",
-            "Ubi-AppId": self.appid,
-            "Authorization": "Basic " + self.token
-        }
-
-        if _new:
-            headers["Ubi-AppId"] = self.appid
-            headers["Authorization"] = "Ubi_v1 t=" + self.key
-
-        resp = await session.post(
-            url="https://public-ubiservices.ubi.com/v3/profiles/sessions",
-            headers=headers,
-            data=json.dumps({"rememberMe": True})
-        )
-
-        data = await resp.json()
-
-        if "ticket" in data:
-            if _new:
-                self.new_key = data.get('ticket')
-                self.new_expiration = data.get('expiration')
-            else:
-                self.key = data.get("ticket")
-                self.expiration = data.get("expiration")
-            self.profileid = data.get('profileId')
-            self.sessionid = data.get("sessionId")
-            self.spaceid = data.get("spaceId")
-            self.userid = data.get("userId")
-            print("[ Logged in successfully ]")
-        else:
-            message = "Unknown Error"
-            if "message" in data and "httpCode" in data:
-                message = f"HTTP {data['httpCode']}: {data['message']}"
-            elif "message" in data:
-                message = data["message"]
-            elif "httpCode" in data:
-                message = str(data["httpCode"])
-            print(f"[ Error: \"{message}\" ]")
-            raise FailedToConnect(message)
-
-        self.save_creds()
-        await self.connect(_new=True)
-
-    async def close(self) -> None:
-        """ Closes the session associated with the auth object """
-        self.save_creds()
-        await self.session.close()
-
-    async def get(self, *args, retries: int = 0, json_: bool = True, new: bool = False, **kwargs) -> dict | str:
-        if (not self.key and not new) or (not self.new_key and new):
-            last_error = None
-            for _ in range(self.max_connect_retries):
-                try:
-                    await self.connect()
-                    break
-                except FailedToConnect as e:
-                    last_error = e
-
-                    print(f"[ Failed to connect for reason \"{e}\" ]")
-            else:
-                # assume this error is going uncaught, so we close the session
-                await self.close()
-
-                if last_error:
-                    raise last_error
-                else:
-                    raise FailedToConnect("Unknown Error")
-
-        if "headers" not in kwargs:
-            kwargs["headers"] = {}
-
-        authorization = kwargs["headers"].get("Authorization") or "Ubi_v1 t=" + (self.new_key if new else self.key)
-        appid = kwargs["headers"].get("Ubi-AppId") or self.appid
-
-        kwargs["headers"]["Authorization"] = authorization
-        kwargs["headers"]["Ubi-AppId"] = appid
-        kwargs["headers"]["Ubi-LocaleCode"] = kwargs["headers"].get("Ubi-LocaleCode") or "en-US"
-        kwargs["headers"]["Ubi-SessionId"] = kwargs["headers"].get("Ubi-SessionId") or self.sessionid
-        kwargs["headers"]["User-Agent"] = kwargs["headers"].get("User-Agent") or "UbiServices_SDK_2020.Release.58_PC64_ansi_static"
-        kwargs["headers"]["Connection"] = kwargs["headers"].get("Connection") or "keep-alive"
-        kwargs["headers"]["expiration"] = kwargs["headers"].get("expiration") or self.expiration
-
-        session = await self.get_session()
-        resp = await session.get(*args, **kwargs)
-
-        if json_:
-            try:
-                data = await resp.json()
-            except Exception:
-                text = await resp.text()
-                message = text.split("h1>")
-                message = message[1][:-2] if len(message) > 1 else text
-                raise InvalidRequest(f"Received a text response, expected JSON response. Message: {message}")
-
-            if "httpCode" in data:
-                if data["httpCode"] == 401:
-                    if retries >= self.max_connect_retries:
-                        # wait 30 seconds before sending another request
-                        self._login_cooldown = time.time() + 30
-
-                    # key no longer works, so remove key and let the following .get() call refresh it
-                    self.key = None
-                    return await self.get(*args, retries=retries + 1, **kwargs)
-                else:
-                    msg = data.get("message", "")
-                    if data["httpCode"] == 404:
-                        msg = f"Missing resource {data.get('resource', args[0])}"
-                    raise InvalidRequest(f"HTTP {data['httpCode']}: {msg}", code=data["httpCode"])
-
-            return data
-        else:
-            return await resp.text()
-    async def get_db(self, *args, retries: int = 0, json_: bool = True, new: bool = False, **kwargs) -> dict | str:
-        if (not self.key and not new) or (not self.new_key and new):
-            last_error = None
-            for _ in range(self.max_connect_retries):
-                try:
-                    await self.connect()
-                    break
-                except FailedToConnect as e:
-                    last_error = e
-            else:
-                # assume this error is going uncaught, so we close the session
-                await self.close()
-
-                if last_error:
-                    raise last_error
-                else:
-                    raise FailedToConnect("Unknown Error")
-
-        if "headers" not in kwargs:
-            kwargs["headers"] = {}
-
-        authorization = kwargs["headers"].get("Authorization") or "Ubi_v1 t=" + (self.new_key if new else self.key)
-        appid = kwargs["headers"].get("Ubi-AppId") or self.appid
-
-
-        kwargs["headers"]["content-type"] = "application/json"
-        kwargs["headers"]["Authorization"] = authorization
-        kwargs["headers"]["Ubi-AppId"] = appid
-        kwargs["headers"]["Ubi-LocaleCode"] = kwargs["headers"].get("Ubi-LocaleCode") or "en-US"
-        kwargs["headers"]["Ubi-SessionId"] = kwargs["headers"].get("Ubi-SessionId") or self.sessionid
-        kwargs["headers"]["User-Agent"] = kwargs["headers"].get("User-Agent") or "UbiServices_SDK_2020.Release.58_PC64_ansi_static"
-        kwargs["headers"]["Connection"] = kwargs["headers"].get("Connection") or "keep-alive"
-        kwargs["headers"]["expiration"] = kwargs["headers"].get("expiration") or self.expiration
-
-        query = {
-            "operationName":"GetItemDetails",
-            "variables": {
-                "spaceId":"0d2ae42d-4c27-4cb7-af6c-2099062302bb",
-                "itemId": self.item_id,
-                "tradeId":"",
-                "fetchTrade":False
-            },
-            "query":"query GetItemDetails($spaceId: String!, $itemId: String!, $tradeId: String!, $fetchTrade: Boolean!) {\n  game(spaceId: $spaceId) {\n    id\n    marketableItem(itemId: $itemId) {\n      id\n      item {\n        ...SecondaryStoreItemFragment\n        ...SecondaryStoreItemOwnershipFragment\n        __typename\n      }\n      marketData {\n        ...MarketDataFragment\n        __typename\n      }\n      paymentLimitations {\n        id\n        paymentItemId\n        minPrice\n        maxPrice\n        __typename\n      }\n      __typename\n    }\n    viewer {\n      meta {\n        id\n        trades(filterBy: {states: [Created], itemIds: [$itemId]}) {\n          nodes {\n            ...TradeFragment\n            __typename\n          }\n          __typename\n        }\n        trade(tradeId: $tradeId) @include(if: $fetchTrade) {\n          ...TradeFragment\n          __typename\n        }\n        __typename\n      }\n      __typename\n    }\n    __typename\n  }\n}\n\nfragment SecondaryStoreItemFragment on SecondaryStoreItem {\n  id\n  assetUrl\n  itemId\n  name\n  tags\n  type\n  viewer {\n    meta {\n      id\n      isReserved\n      __typename\n    }\n    __typename\n  }\n  __typename\n}\n\nfragment SecondaryStoreItemOwnershipFragment on SecondaryStoreItem {\n  viewer {\n    meta {\n      id\n      isOwned\n      quantity\n      __typename\n    }\n    __typename\n  }\n  __typename\n}\n\nfragment MarketDataFragment on MarketableItemMarketData {\n  id\n  sellStats {\n    id\n    paymentItemId\n    lowestPrice\n    highestPrice\n    activeCount\n    __typename\n  }\n  buyStats {\n    id\n    paymentItemId\n    lowestPrice\n    highestPrice\n    activeCount\n    __typename\n  }\n  lastSoldAt {\n    id\n    paymentItemId\n    price\n    performedAt\n    __typename\n  }\n  __typename\n}\n\nfragment TradeFragment on Trade {\n  id\n  tradeId\n  state\n  category\n  createdAt\n  expiresAt\n  lastModifiedAt\n  failures\n  tradeItems {\n    id\n    item {\n      ...SecondaryStoreItemFragment\n      ...SecondaryStoreItemOwnershipFragment\n      __typename\n    }\n    __typename\n  }\n  payment {\n    id\n    item {\n      ...SecondaryStoreItemQuantityFragment\n      __typename\n    }\n    price\n    transactionFee\n    __typename\n  }\n  paymentOptions {\n    id\n    item {\n      ...SecondaryStoreItemQuantityFragment\n      __typename\n    }\n    price\n    transactionFee\n    __typename\n  }\n  paymentProposal {\n    id\n    item {\n      ...SecondaryStoreItemQuantityFragment\n      __typename\n    }\n    price\n    __typename\n  }\n  viewer {\n    meta {\n      id\n      tradesLimitations {\n        ...TradesLimitationsFragment\n        __typename\n      }\n      __typename\n    }\n    __typename\n  }\n  __typename\n}\n\nfragment SecondaryStoreItemQuantityFragment on SecondaryStoreItem {\n  viewer {\n    meta {\n      id\n      quantity\n      __typename\n    }\n    __typename\n  }\n  __typename\n}\n\nfragment TradesLimitationsFragment on UserGameTradesLimitations {\n  id\n  buy {\n    resolvedTransactionCount\n    resolvedTransactionPeriodInMinutes\n    activeTransactionCount\n    __typename\n  }\n  sell {\n    resolvedTransactionCount\n    resolvedTransactionPeriodInMinutes\n    activeTransactionCount\n    resaleLocks {\n      itemId\n      expiresAt\n      __typename\n    }\n    __typename\n  }\n  __typename\n}"
-        }
-        kwargs["data"] = json.dumps(query)
-
-        session = await self.get_session()
-        resp = await session.post(*args, **kwargs)
-
-        if json_:
-            try:
-                data = await resp.json()
-            except Exception:
-                text = await resp.text()
-                message = text.split("h1>")
-                message = message[1][:-2] if len(message) > 1 else text
-                print(f"[ Error: \"{message}\" ]")
-                raise InvalidRequest(f"Received a text response, expected JSON response. Message: {message}")
-
-            if "httpCode" in data:
-                if data["httpCode"] == 401:
-                    if retries >= self.max_connect_retries:
-                        # wait 30 seconds before sending another request
-                        self._login_cooldown = time.time() + 30
-
-                    # key no longer works, so remove key and let the following .get() call refresh it
-                    self.key = None
-
-                    print("[ Broken Key! ]")
-
-                    return await self.get(*args, retries=retries + 1, **kwargs)
-                else:
-                    msg = data.get("message", "")
-                    if data["httpCode"] == 404:
-                        msg = f"Missing resource {data.get('resource', args[0])}"
-
-                    print(f"[ Error: \"{msg}\" ]")
-                    raise InvalidRequest(f"HTTP {data['httpCode']}: {msg}", code=data["httpCode"])
-
-            return data
-        else:
-            return await resp.text()
-    
-    async def try_query_db(self):
-        await asyncio.sleep(0.08)
-
-        res = await self.get_db(f"https://public-ubiservices.ubi.com/v1/profiles/me/uplay/graphql")
-
-        failed = False
-        try:
-            res["errors"]
-            failed = True
-            print("Rate Limited!")
-        except:
-            pass
-        if (failed):
-            return -1
-        
-        name = None
-        tags = None
-        item_type = None
-
-        lowest_buyer = None
-        highest_buyer = None
-        volume_buyers = None
-
-        lowest_seller = None
-        highest_seller = None
-        volume_sellers = None
-
-        last_sold = None
-        
-        asset_url = None
-        try:
-            name = res["data"]["game"]["marketableItem"]["item"]["name"]
-        except:
-            print(f'ERR')    
-        try:
-            tags = res["data"]["game"]["marketableItem"]["item"]["tags"]
-        except:
-            print(f'ERR')    
-        try:
-            item_type = res["data"]["game"]["marketableItem"]["item"]["type"]
-        except:
-            print(f'ERR')    
-
-        try:
-            lowest_buyer = res["data"]["game"]["marketableItem"]["marketData"]["buyStats"][0]["lowestPrice"]
-        except:
-            print(f'ERR')    
-        try:
-            highest_buyer = res["data"]["game"]["marketableItem"]["marketData"]["buyStats"][0]["highestPrice"]
-        except:
-            print(f'ERR')   
-        try: 
-            volume_buyers = res["data"]["game"]["marketableItem"]["marketData"]["buyStats"][0]["activeCount"]
-        except:
-            print(f'ERR')    
-
-        try:
-            lowest_seller = res["data"]["game"]["marketableItem"]["marketData"]["sellStats"][0]["lowestPrice"]
-        except:
-            print(f'ERR')    
-        try:
-            highest_seller = res["data"]["game"]["marketableItem"]["marketData"]["sellStats"][0]["highestPrice"]
-        except:
-            print(f'ERR')    
-        try:
-            volume_sellers = res["data"]["game"]["marketableItem"]["marketData"]["sellStats"][0]["activeCount"]
-        except:
-            print(f'ERR')    
-        
-        try:
-            last_sold = res["data"]["game"]["marketableItem"]["marketData"]["lastSoldAt"][0]["price"]
-        except:
-            print(f'ERR')    
-
-        try:
-            asset_url = res["data"]["game"]["marketableItem"]["item"]["assetUrl"]
-        except:
-            print(f'ERR')    
-        
-        return [
-            name,
-            item_type,
-            tags,
-
-            lowest_buyer,
-            highest_buyer,
-            volume_buyers,
-
-            lowest_seller,
-            highest_seller,
-            volume_sellers,
-
-            last_sold,
-
-            asset_url
-        ]
+from scanner import MarketScanner
+from store import MarketStore, SKETCH_BUCKET
+from graphs import GraphRenderer
+from catalog import Catalog
+from market import Market
+from ubisoft import Auth
+from pool import ConnectionPool
+from capture import CaptureWriter
+from scheduler import PollScheduler
+from leaderboard import Leaderboard, WINDOWS, METRICS
+from sharding import ShardedScanner, load_accounts
+from discovery import Discovery
+from watches import DIRECTIONS, Watch, WatchIndex
+from feed import PriceFeed
+from profiling import LoopWatchdog, sample_profile
+import metrics
 
 account_platform_blocklist = [
     'Coders Rank', 'Fiverr', 'HackerNews', 'Modelhub (NSFW)', 'metacritic', 'xHamster (NSFW)',
@@ -468,42 +37,132 @@ account_platform_blocklist = [
 intents = discord.Intents.default()
 intents.message_content = True
 
-if ( not exists("assets/data.json") ):
-    with open('assets/data.json', 'w') as f:
-        f.write("{}")
+# Rendered `econ id`/`econ name` text and the sketch bucket it was rendered in,
+# dropped whenever scan_market ingests new data for the item
+description_cache: dict[str, tuple[float, str]] = {}
+
+def describe_item(item_id: str) -> str:
+    """ Builds the item description embed text, reusing it until the item changes or the day rolls over """
+    # The 7 day percentile window is whole sketch buckets, so it only moves when a new bucket starts
+    now = time.time()
+    bucket = now - now % SKETCH_BUCKET
+    cached = description_cache.get(item_id)
+    if cached is not None and cached[0] == bucket:
+        return cached[1]
+
+    market.ensure_loaded(item_id)
+    _data = data[item_id]
+    item_stats = stats[item_id]
+    sold_len = item_stats.count
+    ten_RAP = item_stats.ten_rap
+    hundred_RAP = item_stats.hundred_rap
+    all_time_RAP = item_stats.all_time_rap
+
+    msg = f'# Buy:\n\tMinimum Buyer: **{_data["data"][0]}** R6 credits\n\tMaximum Buyer: **{_data["data"][1]}** R6 credits\n\tVolume Buyers: **{_data["data"][2]}**\n'
+    msg += f'# Sell:\n\tMinimum Seller: **{_data["data"][3]}** R6 credits\n\tMaximum Seller: **{_data["data"][4]}** R6 credits\n\tVolume Sellers: **{_data["data"][5]}**\n\tLast Sold: **{_data["sold"][-1][0]}**\n\n'
+    msg += f'### Quick Analysis:\n\tHighest Buyer vs. Lowest Seller: **{(_data["data"][3] or 0) - (_data["data"][1] or 0)}** R6 credits\n\tLast Sale vs. Lowest Seller: **{(_data["data"][3] or 0) - (_data["sold"][-1][0] or 0)} ({round(100 -((_data["sold"][-1][0] or 0) / (_data["data"][3] or 1)) * 100, 2)}%)** R6 credits\n'
+    msg += f'### RAP:\n\t10 - **{ten_RAP}**\n\t100 - **{hundred_RAP}**\n\tAll Time - **{all_time_RAP}**\n\n\t*(Total Data: {sold_len})*\n'
+    msg += f'### Sale Percentiles (p10 / median / p90):\n\tLast 7 Days - {describe_percentiles(item_id, now - 7 * 86400)}\n\tAll Time - {describe_percentiles(item_id)}\n### Tags:\n\n{_data["tags"]}\n### Item ID:\n\t{item_id}'
+
+    description_cache[item_id] = (bucket, msg)
+    return msg
+
+def describe_percentiles(item_id: str, start: float = 0) -> str:
+    """ p10 / median / p90 of an item's sale prices since `start`, merged from its daily sketches """
+    (p10, median, p90), count = store.sale_quantiles(item_id, (0.1, 0.5, 0.9), start=start)
+    if not count:
+        return "*No sales*"
+    return f'**{p10:.0f}** / **{median:.0f}** / **{p90:.0f}** *({count} sales)*'
+
+def check_watches(item_id: str) -> None:
+    """ DMs everyone whose watch on the item was crossed by a new lowest listing or a new sale """
+    _data = data[item_id]
+    prices = set()
+    if "lowest_seller" in market.last_changes:
+        prices.add(_data["data"][3])
+    if "sale" in market.last_changes:
+        prices.add(_data["sold"][-1][0])
+
+    fired = [(watch, price) for price in prices for watch in watches.match(item_id, price)]
+    if fired:
+        # Committed with the rest of the scan pass
+        store.remove_watches([watch.id for watch, _ in fired], commit=False)
+        for watch, price in fired:
+            asyncio.ensure_future(notify_watch(watch, price))
+
+async def notify_watch(watch: Watch, price: int) -> None:
+    with contextlib.suppress(Exception):
+        user = client.get_user(watch.user_id) or await client.fetch_user(watch.user_id)
+        _data = data[watch.item_id]
+        msg = f'**{_data["name"]}** is now at **{price}** R6 credits, {watch.direction} your watch at **{watch.price}**.\n\n*This watch has been removed, run `econ watch` again to keep watching.*'
+        embed=discord.Embed(title=f'Price Watch Triggered', url=f'https://www.ubisoft.com/en-us/game/rainbow-six/siege/marketplace?route=buy%252Fitem-details&itemId={watch.item_id}', description=msg, color=0xFF5733)
+        embed.set_thumbnail(url=_data["asset_url"])
+        await user.send(embed=embed)
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9464) or 0)
+LAZY_HISTORY = bool(os.environ.get("LAZY_HISTORY"))
+FEED_PORT = int(os.environ.get("FEED_PORT", 0) or 0)
+WATCHDOG_THRESHOLD = float(os.environ.get("WATCHDOG_THRESHOLD", 0.25) or 0)
+# Discord user ids allowed to run admin commands such as `econ profile`
+ADMIN_IDS = {int(user_id) for user_id in os.environ.get("ADMIN_IDS", "").split(",") if user_id.strip()}
+PROFILE_MAX_SECONDS = 60
+watchdog = None
+metrics_server = None
+history_loader = None
+
+async def load_history():
+    await market.load_remaining()
+    leaderboard.rebuild(data)
 
-if ( not exists("assets/ids.json") ):
-    with open('assets/ids.json', 'w') as f:
-        f.write('{"black ice r4-c": "aee4bdf2-0b54-4c6d-af93-9fe4848e1f76"}')
+async def on_ready():
+    print("[ Connected to Discord ]")
+    print(time.time())
 
-data_file = open("assets/data.json", "r")
-data = json.loads(data_file.read())
-data_file.close()
+    # on_ready fires again after every reconnect, so only start things once
+    global metrics_server, history_loader, watchdog
+    if METRICS_PORT and metrics_server is None:
+        metrics_server = await metrics.start_server(os.environ.get("METRICS_HOST", "127.0.0.1"), METRICS_PORT)
 
-item_id_file = open("assets/ids.json", "r")
-item_ids = json.loads(item_id_file.read())
-item_id_file.close()
+    # Docker stops the container with SIGTERM; close cleanly so shutdown() runs
+    with contextlib.suppress(NotImplementedError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(client.close()))
 
-client = commands.Bot(command_prefix='.', intents=intents)
+    if WATCHDOG_THRESHOLD and watchdog is None:
+        watchdog = LoopWatchdog(threshold=WATCHDOG_THRESHOLD)
+        watchdog.start()
 
-@client.event
-async def on_ready():
-    print("[ Connected to Discord ]")
-    print(time.time())
+    if FEED_PORT and feed.server is None:
+        await feed.start(os.environ.get("FEED_HOST", "127.0.0.1"), FEED_PORT)
+
+    if market.unloaded and history_loader is None:
+        history_loader = asyncio.ensure_future(load_history())
 
-    print("[ Starting market scan daemon ]")
-    scan_market.start()
-    print("[ Started market scan daemon ]")
+    if not scan_market.is_running():
+        print("[ Starting market scan daemon ]")
+        scan_market.start()
+        print("[ Started market scan daemon ]")
+
+    if DISCOVERY_INTERVAL_HOURS and not discover_items.is_running():
+        discover_items.start()
+
+    if RAW_RETENTION_DAYS and not compact_history.is_running():
+        compact_history.start()
+
+ECON_COMMANDS = {"list", "id", "name", "graph", "profit", "top", "percentiles", "watch", "unwatch", "profile"}
 
-@client.event
 async def on_message(message):
+    cmd = message.content.split(" ")
+    if cmd[0] != "econ" or message.author == client.user:
+        return
+
+    command = cmd[1] if len(cmd) > 1 and cmd[1] in ECON_COMMANDS else "help"
+    with metrics.COMMAND_SECONDS.time(command=command):
+        await handle_message(message)
+
+async def handle_message(message):
     if message.author != client.user:
         cmd = message.content.split(" ")
 
-        name_map_file = open("assets/ids.json", "r")
-        name_map = json.loads(name_map_file.read())
-        name_map_file.close()
-
         match cmd.pop(0):
             case "econ":
                 try:
@@ -518,11 +177,13 @@ async def on_message(message):
                     print("Commands are enabled, continuing...")
                     pass
 
+                catalog.refresh()
+
                 match cmd.pop(0):
                     case "list":
                         msg = ""
                         item_no = 0
-                        for key, value in name_map.items():
+                        for key, value in catalog.items():
                             msg += f'{key}\n'
                             item_no += 1
                             if ( item_no > 99 ):
@@ -534,7 +195,6 @@ async def on_message(message):
                     case "id":
                         item_id = " ".join(cmd).lower()
                         _data = None
-                        print(json.dumps(data, indent=2))
                         try:
                             _data = data[item_id]
                         except:
@@ -545,23 +205,14 @@ async def on_message(message):
                         if ( _data == None):
                             return
 
-                        cleaned_data = [x[0] for x in _data["sold"] if x[0]]
-                        sold_len = len(cleaned_data)
-                        ten_RAP = round(sum(cleaned_data[-10:]) / max(1, min(10, sold_len)))
-                        hundred_RAP = round(sum(cleaned_data[-100:]) / max(1, min(100, sold_len)))
-                        all_time_RAP = round(sum(cleaned_data) / max(1, sold_len))
-
-                        msg = f'# Buy:\n\tMinimum Buyer: **{_data["data"][0]}** R6 credits\n\tMaximum Buyer: **{_data["data"][1]}** R6 credits\n\tVolume Buyers: **{_data["data"][2]}**\n'
-                        msg += f'# Sell:\n\tMinimum Seller: **{_data["data"][3]}** R6 credits\n\tMaximum Seller: **{_data["data"][4]}** R6 credits\n\tVolume Sellers: **{_data["data"][5]}**\n\tLast Sold: **{_data["sold"][-1][0]}**\n\n'
-                        msg += f'### Quick Analysis:\n\tHighest Buyer vs. Lowest Seller: **{(_data["data"][3] or 0) - (_data["data"][1] or 0)}** R6 credits\n\tLast Sale vs. Lowest Seller: **{(_data["data"][3] or 0) - (_data["sold"][-1][0] or 0)} ({round(100 -((_data["sold"][-1][0] or 0) / (_data["data"][3] or 1)) * 100, 2)}%)** R6 credits\n'
-                        msg += f'### RAP:\n\t10 - **{ten_RAP}**\n\t100 - **{hundred_RAP}**\n\tAll Time - **{all_time_RAP}**\n\n\t*(Total Data: {sold_len})*\n### Tags:\n\n{_data["tags"]}\n### Item ID:\n\t{item_id}'
+                        msg = describe_item(item_id)
                         embed=discord.Embed(title=f'{_data["name"]} ({_data["type"]})', url=f'https://www.ubisoft.com/en-us/game/rainbow-six/siege/marketplace?route=buy%252Fitem-details&itemId={item_id}', description=f'{msg}', color=0xFF5733)
                         embed.set_thumbnail(url=_data["asset_url"])
                         await message.channel.send(embed=embed)
                     case "name":
                         _data = None
                         try:
-                            item_id = name_map[" ".join(cmd).lower()]
+                            item_id = catalog.ids[catalog.resolve(" ".join(cmd))]
                             _data = data[item_id]
                         except:
                             msg = "We aren't tracking this item name, try a different name or run 'econ list'!"
@@ -571,16 +222,7 @@ async def on_message(message):
                         if ( _data == None):
                             return
 
-                        cleaned_data = [x[0] for x in _data["sold"] if x[0]]
-                        sold_len = len(cleaned_data)
-                        ten_RAP = round(sum(cleaned_data[-10:]) / max(1, min(10, sold_len)))
-                        hundred_RAP = round(sum(cleaned_data[-100:]) / max(1, min(100, sold_len)))
-                        all_time_RAP = round(sum(cleaned_data) / max(1, sold_len))
-
-                        msg = f'# Buy:\n\tMinimum Buyer: **{_data["data"][0]}** R6 credits\n\tMaximum Buyer: **{_data["data"][1]}** R6 credits\n\tVolume Buyers: **{_data["data"][2]}**\n'
-                        msg += f'# Sell:\n\tMinimum Seller: **{_data["data"][3]}** R6 credits\n\tMaximum Seller: **{_data["data"][4]}** R6 credits\n\tVolume Sellers: **{_data["data"][5]}**\n\tLast Sold: **{_data["sold"][-1][0]}**\n\n'
-                        msg += f'### Quick Analysis:\n\tHighest Buyer vs. Lowest Seller: **{(_data["data"][3] or 0) - (_data["data"][1] or 0)}** R6 credits\n\tLast Sale vs. Lowest Seller: **{(_data["data"][3] or 0) - (_data["sold"][-1][0] or 0)} ({round(100 -((_data["sold"][-1][0] or 0) / (_data["data"][3] or 1)) * 100, 2)}%)** R6 credits\n'
-                        msg += f'### RAP:\n\t10 - **{ten_RAP}**\n\t100 - **{hundred_RAP}**\n\tAll Time - **{all_time_RAP}**\n\n\t*(Total Data: {sold_len})*\n### Tags:\n\n{_data["tags"]}\n### Item ID:\n\t{item_id}'
+                        msg = describe_item(item_id)
                         embed=discord.Embed(title=f'{_data["name"]} ({_data["type"]})', url=f'https://www.ubisoft.com/en-us/game/rainbow-six/siege/marketplace?route=buy%252Fitem-details&itemId={item_id}', description=f'{msg}', color=0xFF5733)
                         embed.set_thumbnail(url=_data["asset_url"])
                         await message.channel.send(embed=embed)
@@ -589,17 +231,11 @@ async def on_message(message):
                         unit_type = cmd.pop(0)
 
                         item_id = " ".join(cmd).lower()
-                        _data = copy.deepcopy(data[item_id])
+                        _data = data[item_id]
+                        market.ensure_loaded(item_id)
                         unit = "days"
                         dividend = 86400
-                        
-                        match num:
-                            case "all":
-                                pass
-                            case _:
-                                _data["sold"] = [x for x in _data["sold"] if x[0]]
-                                _data["sold"] = _data["sold"][-int(num):]
-                                
+
                         match unit_type:
                             case "days":
                                 pass
@@ -614,24 +250,35 @@ async def on_message(message):
                                 embed=discord.Embed(title=f'Help', description=f'# Ask @hiibolt on GH/DC for help!\n\n# Skins:\n{msg}', color=0xFF5733)
                                 embed.set_thumbnail(url="https://github.com/hiibolt/hiibolt/assets/91273156/4a7c1e36-bf24-4f5a-a501-4dc9c92514c4")
                                 await message.channel.send(embed=embed)
+                                return
 
-                        cleaned_data = [x[0] for x in _data["sold"] if x[0]]
-                        cleaned_times = [(time.time() - x[1]) / dividend for x in _data["sold"] if x[0]]
-                     
-                        print(f'{cleaned_times} vs {cleaned_data}')
-
-                        plt.scatter( np.array(cleaned_times), np.array(cleaned_data) )
-                        plt.xlabel( f' Time ({unit} ago) ' )
-                        plt.ylabel( " Purchase Amount " )
-
-                        trendline = np.polyfit( np.array(cleaned_times), np.array(cleaned_data), 1 )
-                        trendline_function = np.poly1d( trendline )
-                        plt.plot( cleaned_times, trendline_function(cleaned_times) )
-                        plt.title( f'{_data["name"]} ({_data["type"]})' )
-                        plt.savefig( f"graphs/{item_id}.png" )
-                        plt.clf()
-
-                        file = discord.File(f'graphs/{item_id}.png')
+                        prices, times = _data["sold"].sales()
+                        # Rollup buckets keep their start time as they fill, so key on the newest raw sale instead
+                        newest = (float(times[-1]), len(times)) if len(times) else None
+                        match num:
+                            case "all":
+                                # Long histories (and compacted ones) are drawn from the rollups,
+                                # one average price per bucket
+                                if len(prices) > GRAPH_MAX_POINTS or RAW_RETENTION_DAYS:
+                                    rollups = store.finest_fitting_rollups(item_id, GRAPH_MAX_POINTS)
+                                    if rollups:
+                                        prices = [total / volume for _, _, _, _, _, volume, total in rollups]
+                                        times = [bucket for bucket, *_ in rollups]
+                            case _:
+                                prices = prices[-int(num):]
+                                times = times[-int(num):]
+
+                        png = await renderer.render(
+                            (item_id, num, unit, newest),
+                            f'{_data["name"]} ({_data["type"]})',
+                            prices,
+                            times,
+                            unit,
+                            dividend,
+                            time.time()
+                        )
+
+                        file = discord.File(io.BytesIO(png), filename=f'{item_id}.png')
                         e = discord.Embed()
                         e.set_image(url=f'attachment://{item_id}.png')
                         await message.channel.send(file = file, embed=e)
@@ -651,69 +298,281 @@ async def on_message(message):
                         if ( _data == None):
                             return
                         
-                        cleaned_data = [x[0] for x in _data["sold"] if x[0]]
-                        sold_len = len(cleaned_data)
-                        ten_RAP = round(sum(cleaned_data[-10:]) / max(1, min(10, sold_len)))
+                        market.ensure_loaded(item_id)
+                        ten_RAP = stats[item_id].ten_rap
 
                         msg = f'\n### Purchased At:\n\t**{purchase_price}** R6 credits\n### Sale Price to Break Even:\n\t**{profitable_sell}** R6 credits\n### Current Net Gain if Sold:\n\t**{((ten_RAP or 0) - purchase_price) * 0.90}** R6 credits'
                         embed=discord.Embed(title=f'Profit Margins', description=f'{msg}', color=0xFF5733)
                         embed.set_thumbnail(url="https://github.com/hiibolt/hiibolt/assets/91273156/4a7c1e36-bf24-4f5a-a501-4dc9c92514c4")
                         await message.channel.send(embed=embed)
+                    case "top":
+                        metric = cmd.pop(0) if cmd else "change"
+                        window = cmd.pop(0) if cmd else "day"
+                        if metric not in METRICS or window not in WINDOWS:
+                            msg = f'The following rankings are available:\n\t- {", ".join(METRICS)}\n\nOver the following windows:\n\t- {", ".join(WINDOWS)}'
+                            embed=discord.Embed(title=f'Help', description=f'# Ask @hiibolt on GH/DC for help!\n\n{msg}', color=0xFF5733)
+                            embed.set_thumbnail(url="https://github.com/hiibolt/hiibolt/assets/91273156/4a7c1e36-bf24-4f5a-a501-4dc9c92514c4")
+                            await message.channel.send(embed=embed)
+                            return
+
+                        msg = ""
+                        for rank, (item_id, value) in enumerate(leaderboard.top(metric, window), 1):
+                            match metric:
+                                case "change":
+                                    value = f'{value:+.2f}%'
+                                case "spread":
+                                    value = f'{value:g} R6 credits'
+                                case "volume":
+                                    value = f'{value:g} sales'
+                            msg += f'{rank}. {data[item_id]["name"]} - **{value}**\n'
+
+                        title = f'Top {metric}' if metric == "spread" else f'Top {metric} (last {window})'
+                        embed=discord.Embed(title=title, description=msg or "No data yet!", color=0xFF5733)
+                        embed.set_thumbnail(url="https://github.com/hiibolt/hiibolt/assets/91273156/4a7c1e36-bf24-4f5a-a501-4dc9c92514c4")
+                        await message.channel.send(embed=embed)
+                    case "percentiles":
+                        item_id = None
+                        try:
+                            days = cmd.pop(0).lower()
+                            start = 0 if days == "all" else time.time() - float(days) * 86400
+                            query = " ".join(cmd)
+                            item_id = query.lower() if query.lower() in data else catalog.ids[catalog.resolve(query)]
+                        except:
+                            pass
+                        if item_id not in data:
+                            msg = "Usage: econ percentiles <# days | all> <item name | item id>"
+                            embed=discord.Embed(title=f'Help', description=f'# Ask @hiibolt on GH/DC for help!\n\n## {msg}', color=0xFF5733)
+                            embed.set_thumbnail(url="https://github.com/hiibolt/hiibolt/assets/91273156/4a7c1e36-bf24-4f5a-a501-4dc9c92514c4")
+                            await message.channel.send(embed=embed)
+                            return
+
+                        window = "All Time" if start == 0 else f'Last {days} Days'
+                        msg = f'### {window} (p10 / median / p90):\n\t{describe_percentiles(item_id, start)}\n\n*Accurate to within 1% of a real sale price, counted in whole days.*'
+                        embed=discord.Embed(title=f'{data[item_id]["name"]} Sale Percentiles', description=msg, color=0xFF5733)
+                        embed.set_thumbnail(url=data[item_id]["asset_url"])
+                        await message.channel.send(embed=embed)
+                    case "watch":
+                        if cmd[:1] == ["list"] or not cmd:
+                            msg = ""
+                            for watch in watches.for_user(message.author.id):
+                                msg += f'{watch.id}. {data[watch.item_id]["name"] if watch.item_id in data else watch.item_id} - {watch.direction} **{watch.price}**\n'
+                            embed=discord.Embed(title=f'Your Price Watches', description=msg or "You aren't watching anything!", color=0xFF5733)
+                            embed.set_thumbnail(url="https://github.com/hiibolt/hiibolt/assets/91273156/4a7c1e36-bf24-4f5a-a501-4dc9c92514c4")
+                            await message.channel.send(embed=embed)
+                            return
+
+                        item_id = None
+                        try:
+                            price = int(cmd.pop())
+                            direction = cmd.pop().lower()
+                            query = " ".join(cmd)
+                            item_id = query.lower() if query.lower() in data else catalog.ids[catalog.resolve(query)]
+                        except:
+                            direction = None
+                        if direction not in DIRECTIONS or item_id not in data:
+                            msg = "Usage: econ watch <item name | item id> <below | above> <price>"
+                            embed=discord.Embed(title=f'Help', description=f'# Ask @hiibolt on GH/DC for help!\n\n## {msg}', color=0xFF5733)
+                            embed.set_thumbnail(url="https://github.com/hiibolt/hiibolt/assets/91273156/4a7c1e36-bf24-4f5a-a501-4dc9c92514c4")
+                            await message.channel.send(embed=embed)
+                            return
+
+                        watch_id = store.add_watch(message.author.id, item_id, direction, price, time.time())
+                        watches.add(Watch(watch_id, message.author.id, item_id, direction, price))
+                        msg = f'You will be sent a DM once **{data[item_id]["name"]}** goes {direction} **{price}** R6 credits.\n\n*Watch ID: {watch_id}*'
+                        embed=discord.Embed(title=f'Watching', description=msg, color=0xFF5733)
+                        embed.set_thumbnail(url=data[item_id]["asset_url"])
+                        await message.channel.send(embed=embed)
+                    case "unwatch":
+                        watch = watches.watches.get(int(cmd[0])) if cmd and cmd[0].isdigit() else None
+                        if watch is None or watch.user_id != message.author.id:
+                            msg = "You don't have a watch with that ID, run 'econ watch list'!"
+                        else:
+                            watches.remove(watch.id)
+                            store.remove_watches([watch.id])
+                            msg = f'Stopped watching {data[watch.item_id]["name"] if watch.item_id in data else watch.item_id}.'
+                        embed=discord.Embed(title=f'Price Watches', description=msg, color=0xFF5733)
+                        embed.set_thumbnail(url="https://github.com/hiibolt/hiibolt/assets/91273156/4a7c1e36-bf24-4f5a-a501-4dc9c92514c4")
+                        await message.channel.send(embed=embed)
+                    case "profile":
+                        if message.author.id not in ADMIN_IDS:
+                            return
+
+                        seconds = min(PROFILE_MAX_SECONDS, float(cmd[0])) if cmd and cmd[0].replace(".", "", 1).isdigit() else 10
+                        await message.channel.send(f'Profiling for {seconds:g} seconds...')
+                        profile = await asyncio.to_thread(sample_profile, seconds)
+                        file = discord.File(io.BytesIO(profile.encode("utf-8")), filename=f'profile-{int(time.time())}.folded')
+                        await message.channel.send('Collapsed stacks, open with speedscope or flamegraph.pl:', file=file)
                     case _:
-                        msg = "The following commands are available:\n\n\t- econ name <item name>\n\n\t- econ id <item id>\n\n\t- econ graph <# entries (1, 2, ... | all)> <unit (days | hours | minutes)>\n\n\t- econ profit <what you purchased for> <item id>"
+                        msg = "The following commands are available:\n\n\t- econ name <item name>\n\n\t- econ id <item id>\n\n\t- econ graph <# entries (1, 2, ... | all)> <unit (days | hours | minutes)>\n\n\t- econ profit <what you purchased for> <item id>\n\n\t- econ top <change | spread | volume> <window (hour | day | week)>\n\n\t- econ percentiles <# days | all> <item name | item id>\n\n\t- econ watch <item name | item id> <below | above> <price>\n\n\t- econ watch list\n\n\t- econ unwatch <watch id>"
                         embed=discord.Embed(title=f'Help', description=f'# Ask @hiibolt on GH/DC for help!\n\n# Skins:\n{msg}', color=0xFF5733)
                         embed.set_thumbnail(url="https://github.com/hiibolt/hiibolt/assets/91273156/4a7c1e36-bf24-4f5a-a501-4dc9c92514c4")
                         await message.channel.send(embed=embed)
 
-@tasks.loop(minutes=5)
+# Every item is polled at least this often; hot items are polled more often
+SCAN_INTERVAL_MINUTES = 5
+SCAN_MIN_INTERVAL = float(os.environ.get("SCAN_MIN_INTERVAL", 30))
+SCAN_TICK_SECONDS = int(os.environ.get("SCAN_TICK_SECONDS", 15))
+SCAN_CONCURRENCY = int(os.environ.get("SCAN_CONCURRENCY", 8))
+SCAN_RATE = float(os.environ.get("SCAN_RATE", 12.5))
+SCAN_BATCH_SIZE = int(os.environ.get("SCAN_BATCH_SIZE", 10))
+# Optional JSON list of {"email", "password"} accounts; each gets a worker process scanning its own share of items
+SCAN_ACCOUNTS = os.environ.get("SCAN_ACCOUNTS")
+SCAN_SHARDS = len(load_accounts(SCAN_ACCOUNTS)) if SCAN_ACCOUNTS else 1
+# A shard still working on a pass after this many seconds is restarted and its items retried
+SCAN_PASS_TIMEOUT = float(os.environ.get("SCAN_PASS_TIMEOUT", 300))
+# Most items polled per tick, by default what the request rate can cover in one tick
+SCAN_BUDGET = int(os.environ.get("SCAN_BUDGET", SCAN_RATE * SCAN_BATCH_SIZE * SCAN_TICK_SECONDS * SCAN_SHARDS))
+metrics.SCAN_INTERVAL_SECONDS.set(SCAN_TICK_SECONDS)
+
+scheduler = PollScheduler(min_interval=SCAN_MIN_INTERVAL, max_interval=SCAN_INTERVAL_MINUTES * 60)
+
+# Raw sales older than this are compacted into the rollups; unset keeps them forever
+RAW_RETENTION_DAYS = float(os.environ.get("RAW_RETENTION_DAYS", 0) or 0)
+# `econ graph all` switches to rollups past this many points
+GRAPH_MAX_POINTS = int(os.environ.get("GRAPH_MAX_POINTS", 2000))
+
+# How often the marketplace listing is walked for new items; unset leaves ids.json hand-maintained
+DISCOVERY_INTERVAL_HOURS = float(os.environ.get("DISCOVERY_INTERVAL_HOURS", 0) or 0)
+
+# If set, every raw GraphQL response is also written to compressed segments here for replay.py
+CAPTURE_DIR = os.environ.get("CAPTURE_DIR")
+
+auth: Auth | None = None
+sharded_scanner: ShardedScanner | None = None
+
+def get_auth() -> Auth:
+    """ Returns the process-wide Ubisoft client, creating it on first use """
+    global auth
+    if auth is None:
+        print("[ Opening Session ]")
+        pool = ConnectionPool(
+            limit_per_host=int(os.environ.get("HTTP_LIMIT_PER_HOST", 32)),
+            dns_ttl=int(os.environ.get("HTTP_DNS_TTL", 300)),
+            keepalive=float(os.environ.get("HTTP_KEEPALIVE", 60)),
+        )
+        capture = CaptureWriter(CAPTURE_DIR) if CAPTURE_DIR else None
+        auth = Auth(os.environ["AUTH_EMAIL"], os.environ["AUTH_PW"], pool=pool, capture=capture)
+    return auth
+
+def get_sharded_scanner() -> ShardedScanner:
+    """ Returns the process-wide sharded scanner, starting its workers on first use """
+    global sharded_scanner
+    if sharded_scanner is None:
+        accounts = load_accounts(SCAN_ACCOUNTS)
+        print(f"[ Starting {len(accounts)} scan shards ]")
+        sharded_scanner = ShardedScanner(
+            accounts,
+            concurrency=SCAN_CONCURRENCY,
+            rate=SCAN_RATE,
+            batch_size=SCAN_BATCH_SIZE,
+            pass_timeout=SCAN_PASS_TIMEOUT,
+            auth_options={"capture_dir": CAPTURE_DIR} if CAPTURE_DIR else None
+        )
+        sharded_scanner.start()
+    return sharded_scanner
+
+@tasks.loop(seconds=SCAN_TICK_SECONDS)
 async def scan_market():
     with contextlib.suppress(Exception):
-        print("[ Opening Session ]")
+        catalog.refresh()
+        scheduler.sync(dict(catalog.ids))
+        due = scheduler.due(SCAN_BUDGET)
+        if not due:
+            return
+
+        pending = set(due.values())
+        def on_result(item_id: str, changed: bool | None) -> None:
+            pending.discard(item_id)
+            scheduler.reschedule(item_id, data[item_id]["sold"] if item_id in data else None, changed)
 
-        auth = Auth(os.environ["AUTH_EMAIL"], os.environ["AUTH_PW"])
-
-        print("[ Scanning market... ]")
-        for key, item_id in item_ids.items():
-            print(f'[ - [ Scanning {key} ] ]')
-
-            auth.item_id = item_id
-            res = await auth.try_query_db()
-            if (not res):
-                print("Rate Limited!")
-                continue
-
-            # Meta: NAME | TYPE | TAGS - Buyers: LOW | HIGH | VOL - Sellers: LOW | HIGH | VOL
-            try:
-                data[item_id]
-            except:
-                data[item_id] = {
-                    "name": res[0],
-                    "type": res[1],
-                    "tags": res[2],
-                    "asset_url": res[10],
-                    "sold": [],
-                    "data": None
-                }
-            if data[item_id]["data"] == None or data[item_id]["data"] != [res[3], res[4], res[5], res[6], res[7], res[8]]:
-                data[item_id]["data"] = [res[3], res[4], res[5], res[6], res[7], res[8]]
-                print('[ - - NEW PRIMARY DATA ]')
-            
-            if len(data[item_id]["sold"]) == 0 or data[item_id]["sold"][len(data[item_id]["sold"]) - 1][0] != res[9]:
-                data[item_id]["sold"] = data[item_id]["sold"] + [[res[9], time.time()]]
-                print('[ - - NEW LAST SOLD ]')
-
-            print(f'[ ~ [ Done checking {key} ] ]')
-            
-        print("[ Closing Session ]")
-        await auth.close()
-
-        print("[ WRITING TO 'data.json' ]")
-
-        data_file = open("assets/data.json", "w")
-        data_file.write(json.dumps(data, indent=2))
-        data_file.close()
-
-        print("[ FINISHED WRITING TO 'data.json' ]")
-                            
-
-client.run(os.environ["TOKEN"])
+        # due() took the items off the schedule, so from here on they must go back whatever fails
+        try:
+            if SCAN_ACCOUNTS:
+                scanner = get_sharded_scanner()
+            else:
+                scanner = MarketScanner(get_auth(), concurrency=SCAN_CONCURRENCY, rate=SCAN_RATE, batch_size=SCAN_BATCH_SIZE)
+
+            print(f"[ Scanning {len(due)} due items of {len(scheduler)}... ]")
+            changed = await market.scan(scanner, due, on_result=on_result)
+        finally:
+            # Anything the pass never got to goes back in the queue
+            for item_id in pending:
+                scheduler.reschedule(item_id, None, None)
+
+        leaderboard.rebuild(data)
+
+        print(f'[ Scanned {scanner.last_pass_items} items in {scanner.last_pass_duration:.2f}s ({scanner.last_pass_failures} failed, {changed} changed) ]')
+        metrics.SCAN_PASS_SECONDS.observe(scanner.last_pass_duration)
+        metrics.SCAN_LAST_PASS_SECONDS.set(scanner.last_pass_duration)
+        metrics.SCAN_ITEMS.inc(scanner.last_pass_items - scanner.last_pass_failures, outcome="ok")
+        metrics.SCAN_ITEMS.inc(scanner.last_pass_failures, outcome="failed")
+        pool_stats = scanner.pool_stats() if SCAN_ACCOUNTS else auth.pool.stats()
+        metrics.HTTP_CONNECTIONS_OPEN.set(pool_stats["in_use"], state="in_use")
+        metrics.HTTP_CONNECTIONS_OPEN.set(pool_stats["idle"], state="idle")
+        metrics.HTTP_CONNECTION_REUSE_RATIO.set(pool_stats["reuse_ratio"])
+        if scanner.last_pass_duration > SCAN_TICK_SECONDS:
+            metrics.SCAN_OVERRUNS.inc()
+            print(f'[ Warning: scan pass overran the {SCAN_TICK_SECONDS} second tick! ]')
+
+@tasks.loop(hours=1)
+async def compact_history():
+    with contextlib.suppress(Exception):
+        dropped = market.compact(RAW_RETENTION_DAYS * 86400)
+        if dropped:
+            print(f'[ Compacted {dropped} raw sales older than {RAW_RETENTION_DAYS:g} days into rollups ]')
+
+@tasks.loop(hours=DISCOVERY_INTERVAL_HOURS or 24)
+async def discover_items():
+    try:
+        await Discovery(get_auth(), catalog).run()
+    except Exception as e:
+        # The cursor was saved after the last good page, so the next run resumes there
+        print(f'[ Discovery stopped early for reason "{e}" ]')
+
+def shutdown() -> None:
+    """ Stops the graph and scan workers and flushes captures and uncommitted market data to disk """
+    renderer.close()
+    if sharded_scanner is not None:
+        sharded_scanner.close()
+    if auth is not None and auth.capture is not None:
+        auth.capture.close()
+    store.close()
+
+
+# Graph workers re-import this file, so everything expensive (the renderer's
+# process pool, the Discord client, the store) happens under this guard
+if __name__ == "__main__":
+    renderer = GraphRenderer()
+
+    client = commands.Bot(command_prefix='.', intents=intents)
+    client.event(on_ready)
+    client.event(on_message)
+
+    if ( not exists("assets/ids.json") ):
+        with open('assets/ids.json', 'w') as f:
+            f.write('{"black ice r4-c": "aee4bdf2-0b54-4c6d-af93-9fe4848e1f76"}')
+
+    store = MarketStore("assets/market.db")
+    store.migrate_json("assets/data.json")
+    # With LAZY_HISTORY, sale history is read after Discord is ready (or on first use) instead of before
+    market = Market(store, lazy=LAZY_HISTORY, history_dir=os.environ.get("HISTORY_MMAP_DIR"))
+    market.listeners.append(lambda item_id: description_cache.pop(item_id, None))
+
+    watches = WatchIndex.from_rows(store.load_watches())
+    market.listeners.append(check_watches)
+
+    feed = PriceFeed(market.data)
+    market.listeners.append(feed.publish)
+
+    data = market.data
+    stats = market.stats
+
+    catalog = Catalog("assets/ids.json")
+
+    leaderboard = Leaderboard()
+    leaderboard.rebuild(data)
+
+    try:
+        client.run(os.environ["TOKEN"])
+    finally:
+        shutdown()
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import hashlib
+import itertools
+import json
+import multiprocessing
+import queue
+import time
+from dataclasses import dataclass
+
+from item_details import ItemDetails, Unchanged
+from metrics import merge_deltas
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """ Consistent hashing of item ids onto shards
+
+    Each shard owns `replicas` points on the ring, and an item belongs to the
+    shard owning the first point at or after the item's hash, so adding or
+    removing an account only moves roughly 1/N of the items.
+    """
+
+    def __init__(self, shards: list[str], replicas: int = 64):
+        points = sorted(
+            (_hash(f'{shard}#{replica}'), index)
+            for index, shard in enumerate(shards)
+            for replica in range(replicas)
+        )
+        self._hashes: list[int] = [point for point, _ in points]
+        self._owners: list[int] = [owner for _, owner in points]
+
+    def owner(self, item_id: str) -> int:
+        """ Index of the shard that owns `item_id` """
+        i = bisect.bisect_left(self._hashes, _hash(item_id))
+        return self._owners[i % len(self._owners)]
+
+    def partition(self, items: dict[str, str], shards: int) -> list[dict[str, str]]:
+        parts = [{} for _ in range(shards)]
+        for key, item_id in items.items():
+            parts[self.owner(item_id)][key] = item_id
+        return parts
+
+
+def load_accounts(path: str) -> list[tuple[str, str]]:
+    """ Reads [{"email": ..., "password": ...}, ...] scanning accounts from a JSON file """
+    with open(path, "r") as f:
+        return [(account["email"], account["password"]) for account in json.load(f)]
+
+
+@dataclass(slots=True)
+class ShardReport:
+    """ Sent by a worker after each pass: what its metrics recorded meanwhile, and its connection pool's state """
+    shard: str
+    metrics: dict
+    pool: dict
+
+
+def _run_worker(email: str, password: str, requests, results, options: dict, auth_options: dict) -> None:
+    asyncio.run(_serve(email, password, requests, results, options, auth_options))
+
+async def _serve(email: str, password: str, requests, results, options: dict, auth_options: dict) -> None:
+    """ Worker process body: scans whatever item sets the coordinator sends, streaming results back """
+    from capture import CaptureWriter
+    from metrics import take_deltas
+    from scanner import MarketScanner
+    from ubisoft import Auth
+
+    loop = asyncio.get_running_loop()
+    capture_dir = auth_options.pop("capture_dir", None)
+    capture = CaptureWriter(capture_dir, prefix=f"shard-{_hash(email):x}") if capture_dir else None
+    auth = Auth(email, password, capture=capture, **auth_options)
+    scanner = MarketScanner(auth, **options)
+    try:
+        while True:
+            request = await loop.run_in_executor(None, requests.get)
+            if request is None:
+                return
+
+            pass_id, items, known = request
+            async for key, item_id, res in scanner.scan(items, known):
+                results.put((pass_id, key, item_id, res))
+            # Also tells the coordinator this shard is done with the pass
+            results.put((pass_id, None, None, ShardReport(email, take_deltas(), auth.pool.stats())))
+    finally:
+        await auth.close()
+        if capture is not None:
+            capture.close()
+
+
+class ShardedScanner:
+    """ Drop-in MarketScanner replacement that fans each pass out over one worker process per account
+
+    Items are split across accounts with a HashRing, so each account keeps
+    polling the same items between passes. Workers keep their Auth (and its
+    ticket and connections) for as long as they live; results are streamed
+    back as they arrive and yielded in the same (key, item_id, result) form
+    as MarketScanner.scan, so Market.scan is unchanged. A worker that dies
+    mid-pass, or is still busy `pass_timeout` seconds after the pass began,
+    has its outstanding items reported as failed and is restarted. Each
+    worker's metrics are merged into this process's after every pass.
+    """
+
+    def __init__(self, accounts: list[tuple[str, str]], concurrency: int = 8, rate: float = 12.5, batch_size: int = 1, poll_interval: float = 1.0, pass_timeout: float = 300, auth_options: dict = None):
+        self.accounts: list[tuple[str, str]] = accounts
+        self.options: dict = {"concurrency": concurrency, "rate": rate, "batch_size": batch_size}
+        self.auth_options: dict = auth_options or {}
+        self.poll_interval: float = poll_interval
+        self.pass_timeout: float = pass_timeout
+        self.ring: HashRing = HashRing([email for email, _ in accounts])
+        self._shards: dict[str, int] = {email: index for index, (email, _) in enumerate(accounts)}
+        self._pool_stats: dict[int, dict] = {}
+
+        self._context = multiprocessing.get_context("spawn")
+        self._results = self._context.Queue()
+        self._requests: list = [self._context.Queue() for _ in accounts]
+        self._workers: list = [None] * len(accounts)
+        self._passes = itertools.count()
+
+        self.last_pass_duration: float = 0.0
+        self.last_pass_items: int = 0
+        self.last_pass_failures: int = 0
+
+    def _start_worker(self, index: int) -> None:
+        email, password = self.accounts[index]
+        self._requests[index] = self._context.Queue()
+        worker = self._context.Process(
+            target=_run_worker,
+            args=(email, password, self._requests[index], self._results, self.options, self.auth_options),
+            name=f"scan-shard-{index}",
+            daemon=True
+        )
+        worker.start()
+        self._workers[index] = worker
+
+    def start(self) -> None:
+        for index, worker in enumerate(self._workers):
+            if worker is None or not worker.is_alive():
+                self._start_worker(index)
+
+    def close(self) -> None:
+        for index, worker in enumerate(self._workers):
+            if worker is not None and worker.is_alive():
+                self._requests[index].put(None)
+        for worker in self._workers:
+            if worker is not None:
+                worker.join(timeout=5)
+                if worker.is_alive():
+                    worker.terminate()
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def pool_stats(self) -> dict:
+        """ ConnectionPool.stats() summed over the latest report from every shard """
+        totals = dict.fromkeys(("open", "in_use", "idle", "created", "reused", "recycles"), 0)
+        for stats in self._pool_stats.values():
+            for name in totals:
+                totals[name] += stats.get(name, 0)
+        totals["reuse_ratio"] = totals["reused"] / max(1, totals["created"] + totals["reused"])
+        return totals
+
+    async def scan(self, items: dict[str, str], known: dict[str, int] = None):
+        """ Scans every (key, item_id) pair across the shards, yielding (key, item_id, result) as they arrive """
+        known = known or {}
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        self.start()
+
+        pass_id = next(self._passes)
+        outstanding: dict[int, dict[str, str]] = {}
+        for index, part in enumerate(self.ring.partition(items, len(self.accounts))):
+            if part:
+                outstanding[index] = dict(part)
+                self._requests[index].put((pass_id, part, {item_id: known[item_id] for item_id in part.values() if item_id in known}))
+        owners = {item_id: index for index, part in outstanding.items() for item_id in part.values()}
+
+        failures = 0
+        deadline = start + self.pass_timeout
+        while outstanding:
+            try:
+                message = await loop.run_in_executor(None, self._results.get, True, self.poll_interval)
+            except queue.Empty:
+                message = None
+
+            if message is None or time.perf_counter() >= deadline:
+                # Report whatever a dead or hung worker still owed as failed, then replace it
+                for index in list(outstanding):
+                    worker = self._workers[index]
+                    if worker.is_alive() and time.perf_counter() < deadline:
+                        continue
+                    if worker.is_alive():
+                        print(f"[ Scan shard {index} still busy after {self.pass_timeout:g}s, restarting it ]")
+                        worker.terminate()
+                        worker.join(timeout=5)
+                    else:
+                        print(f"[ Scan shard {index} died, restarting it ]")
+                    for key, item_id in outstanding.pop(index).items():
+                        failures += 1
+                        yield key, item_id, -1
+                    self._start_worker(index)
+            if message is None:
+                continue
+
+            result_pass, key, item_id, res = message
+            if isinstance(res, ShardReport):
+                # Metrics count even when they come from an abandoned pass
+                merge_deltas(res.metrics)
+                index = self._shards[res.shard]
+                self._pool_stats[index] = res.pool
+                if result_pass == pass_id:
+                    for key, item_id in outstanding.pop(index, {}).items():
+                        failures += 1
+                        yield key, item_id, -1
+                continue
+
+            # Leftovers from a pass that was abandoned part way through
+            if result_pass != pass_id:
+                continue
+
+            index = owners.get(item_id)
+            if index not in outstanding or outstanding[index].pop(key, None) is None:
+                continue
+
+            if not isinstance(res, (ItemDetails, Unchanged)):
+                failures += 1
+            yield key, item_id, res
+
+        self.last_pass_duration = time.perf_counter() - start
+        self.last_pass_items = len(items)
+        self.last_pass_failures = failures
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import math
+
+import numpy as np
+
+
+class QuantileSketch:
+    """ Mergeable quantile sketch for positive prices, with bounded relative error
+
+    Values are counted in logarithmic buckets, each `1 + relative_accuracy`
+    wider than the last (the DDSketch scheme), so any quantile comes back
+    within `relative_accuracy` of a true sample value. Memory grows with the
+    log of the price range, not with the number of sales, and two sketches
+    merge by adding bucket counts. That is what lets per-day sketches be
+    combined into any window.
+    """
+
+    __slots__ = ("relative_accuracy", "_gamma_log", "buckets", "count")
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy: float = relative_accuracy
+        self._gamma_log: float = math.log((1 + relative_accuracy) / (1 - relative_accuracy))
+        self.buckets: dict[int, int] = {}
+        self.count: int = 0
+
+    def _key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._gamma_log)
+
+    def _value(self, key: int) -> float:
+        # Midpoint of the bucket, in relative terms, so the error is symmetric
+        return 2 * math.exp(key * self._gamma_log) / (1 + math.exp(self._gamma_log))
+
+    def add(self, value: float, count: int = 1) -> None:
+        if not value or value <= 0:
+            return
+        key = self._key(value)
+        self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += count
+
+    def merge(self, other: QuantileSketch) -> QuantileSketch:
+        """ Folds `other` (built with the same accuracy) into this sketch """
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += other.count
+        return self
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        keys = np.fromiter(self.buckets.keys(), dtype=np.int64, count=len(self.buckets))
+        counts = np.fromiter(self.buckets.values(), dtype=np.int64, count=len(self.buckets))
+        order = np.argsort(keys)
+        rank = q * (self.count - 1)
+        index = int(np.searchsorted(np.cumsum(counts[order]), rank, side="right"))
+        return self._value(int(keys[order][min(index, len(keys) - 1)]))
+
+    def quantiles(self, qs: tuple[float, ...]) -> list[float | None]:
+        return [self.quantile(q) for q in qs]
+
+    def to_bytes(self) -> bytes:
+        keys = np.fromiter(self.buckets.keys(), dtype=np.int32, count=len(self.buckets))
+        counts = np.fromiter(self.buckets.values(), dtype=np.int64, count=len(self.buckets))
+        return np.float64(self.relative_accuracy).tobytes() + keys.tobytes() + counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> QuantileSketch:
+        sketch = cls(float(np.frombuffer(blob, dtype=np.float64, count=1)[0]))
+        size = (len(blob) - 8) // 12
+        keys = np.frombuffer(blob, dtype=np.int32, count=size, offset=8)
+        counts = np.frombuffer(blob, dtype=np.int64, count=size, offset=8 + 4 * size)
+        sketch.buckets = dict(zip(keys.tolist(), counts.tolist()))
+        sketch.count = int(counts.sum())
+        return sketch
+
+    def __len__(self) -> int:
+        return self.count
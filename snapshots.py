@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import zlib
+
+FIELD_COUNT = 6
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+def _unzigzag(n: int) -> int:
+    return (n >> 1) ^ -(n & 1)
+
+def _write_varint(out: bytearray, n: int) -> None:
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _read_varint(buf: bytes, pos: int) -> tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_chunk(samples: list[tuple[float, list]]) -> bytes:
+    """ Packs (timestamp, [6 order-book values]) samples as zlib-compressed deltas
+
+    Each sample is a millisecond timestamp delta, a bitmask of which values
+    are present, then a zigzag varint delta for each present value against
+    the last present value of the same field.
+    """
+    out = bytearray()
+    _write_varint(out, len(samples))
+
+    last_ms = 0
+    last = [0] * FIELD_COUNT
+    for taken_at, values in samples:
+        ms = round(taken_at * 1000)
+        _write_varint(out, _zigzag(ms - last_ms))
+        last_ms = ms
+
+        mask = 0
+        for i, value in enumerate(values):
+            if value is not None:
+                mask |= 1 << i
+        out.append(mask)
+
+        for i, value in enumerate(values):
+            if value is not None:
+                _write_varint(out, _zigzag(value - last[i]))
+                last[i] = value
+
+    return zlib.compress(bytes(out), 9)
+
+def decode_chunk(blob: bytes) -> list[tuple[float, list]]:
+    """ Inverse of encode_chunk """
+    buf = zlib.decompress(blob)
+    count, pos = _read_varint(buf, 0)
+
+    samples = []
+    last_ms = 0
+    last = [0] * FIELD_COUNT
+    for _ in range(count):
+        delta, pos = _read_varint(buf, pos)
+        last_ms += _unzigzag(delta)
+
+        mask = buf[pos]
+        pos += 1
+
+        values = []
+        for i in range(FIELD_COUNT):
+            if mask & (1 << i):
+                delta, pos = _read_varint(buf, pos)
+                last[i] += _unzigzag(delta)
+                values.append(last[i])
+            else:
+                values.append(None)
+        samples.append((last_ms / 1000, values))
+
+    return samples
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from collections import deque
+
+
+class ItemStats:
+    """ Rolling sale aggregates for one item, updated as each sale is ingested """
+
+    __slots__ = ("recent", "sum_10", "sum_100", "total", "count")
+
+    def __init__(self):
+        self.recent: deque[int] = deque(maxlen=100)
+        self.sum_10: int = 0
+        self.sum_100: int = 0
+        self.total: int = 0
+        self.count: int = 0
+
+    @classmethod
+    def from_history(cls, history) -> ItemStats:
+        """ Computes the aggregates straight from a PriceHistory's price column """
+        stats = cls()
+        prices = history.prices
+        sold = prices[prices != 0]
+
+        stats.recent.extend(sold[-100:].tolist())
+        stats.sum_10 = sum(list(stats.recent)[-10:])
+        stats.sum_100 = sum(stats.recent)
+        stats.total = int(sold.sum(dtype="int64"))
+        stats.count = len(sold)
+        return stats
+
+    def add(self, price: int | None) -> None:
+        """ Folds one sale into the aggregates; empty prices are not counted """
+        if not price:
+            return
+
+        if len(self.recent) >= 10:
+            self.sum_10 -= self.recent[-10]
+        if len(self.recent) == self.recent.maxlen:
+            self.sum_100 -= self.recent[0]
+
+        self.recent.append(price)
+        self.sum_10 += price
+        self.sum_100 += price
+        self.total += price
+        self.count += 1
+
+    @property
+    def ten_rap(self) -> int:
+        return round(self.sum_10 / max(1, min(10, len(self.recent))))
+
+    @property
+    def hundred_rap(self) -> int:
+        return round(self.sum_100 / max(1, len(self.recent)))
+
+    @property
+    def all_time_rap(self) -> int:
+        return round(self.total / max(1, self.count))
+
+
+class MarketStats:
+    """ ItemStats for every tracked item """
+
+    def __init__(self):
+        self.items: dict[str, ItemStats] = {}
+
+    @classmethod
+    def from_data(cls, data: dict, totals: dict[str, tuple[int, int]] = None) -> MarketStats:
+        """ Builds the aggregates from already loaded history, once at startup
+
+        `totals` supplies all-time (sum, count) pairs for items whose older
+        raw sales have been compacted away.
+        """
+        stats = cls()
+        for item_id, item in data.items():
+            stats.items[item_id] = ItemStats.from_history(item["sold"])
+            if totals and item_id in totals:
+                stats.items[item_id].total, stats.items[item_id].count = totals[item_id]
+        return stats
+
+    def add_sale(self, item_id: str, price: int | None) -> None:
+        if item_id not in self.items:
+            self.items[item_id] = ItemStats()
+        self.items[item_id].add(price)
+
+    def __getitem__(self, item_id: str) -> ItemStats:
+        return self.items.get(item_id) or ItemStats()
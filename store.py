@@ -0,0 +1,408 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import time
+
+from history import PriceHistory
+from sketch import QuantileSketch
+from snapshots import decode_chunk, encode_chunk
+
+SNAPSHOT_FIELDS = ["low_buyer", "high_buyer", "vol_buyers", "low_seller", "high_seller", "vol_sellers"]
+
+# Bucket widths, in seconds, of the OHLC rollups kept for every item
+ROLLUP_RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+
+# Priced raw sales always kept per item by compaction, so the 100 sale RAP
+# and `econ graph 100` read the same after a restart as before it
+MIN_RAW_SALES = 100
+
+# Width, in seconds, of the buckets each item's sale price sketches are kept in
+SKETCH_BUCKET = ROLLUP_RESOLUTIONS["day"]
+
+
+class MarketStore:
+    """ Append-only SQLite store for tracked items, their sales and order-book snapshots """
+
+    def __init__(self, path: str = "assets/market.db", chunk_size: int = 256):
+        self.path: str = path
+        self.db: sqlite3.Connection = sqlite3.connect(path)
+
+        # WAL keeps readers unblocked and makes each commit a cheap append
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS items (
+                item_id TEXT PRIMARY KEY,
+                name TEXT,
+                type TEXT,
+                tags TEXT,
+                asset_url TEXT
+            );
+            CREATE TABLE IF NOT EXISTS sales (
+                item_id TEXT NOT NULL,
+                price INTEGER,
+                sold_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS sales_by_item ON sales (item_id, sold_at);
+            CREATE TABLE IF NOT EXISTS snapshots (
+                item_id TEXT NOT NULL,
+                taken_at REAL NOT NULL,
+                low_buyer INTEGER,
+                high_buyer INTEGER,
+                vol_buyers INTEGER,
+                low_seller INTEGER,
+                high_seller INTEGER,
+                vol_sellers INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS snapshots_by_item ON snapshots (item_id, taken_at);
+            CREATE TABLE IF NOT EXISTS snapshot_chunks (
+                item_id TEXT NOT NULL,
+                start_at REAL NOT NULL,
+                end_at REAL NOT NULL,
+                count INTEGER NOT NULL,
+                samples BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS snapshot_chunks_by_item ON snapshot_chunks (item_id, end_at);
+            CREATE TABLE IF NOT EXISTS rollups (
+                item_id TEXT NOT NULL,
+                resolution INTEGER NOT NULL,
+                bucket REAL NOT NULL,
+                open INTEGER NOT NULL,
+                high INTEGER NOT NULL,
+                low INTEGER NOT NULL,
+                close INTEGER NOT NULL,
+                volume INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                PRIMARY KEY (item_id, resolution, bucket)
+            );
+            CREATE TABLE IF NOT EXISTS watches (
+                id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                item_id TEXT NOT NULL,
+                direction TEXT NOT NULL,
+                price INTEGER NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sketches (
+                item_id TEXT NOT NULL,
+                bucket REAL NOT NULL,
+                sketch BLOB NOT NULL,
+                PRIMARY KEY (item_id, bucket)
+            );
+        """)
+        self.db.commit()
+
+        # Sketches touched since the last commit, written back by _flush_sketches()
+        self._sketches: dict[tuple[str, float], QuantileSketch] = {}
+
+        if self.db.execute("SELECT 1 FROM rollups LIMIT 1").fetchone() is None:
+            self._backfill_rollups()
+        if self.db.execute("SELECT 1 FROM sketches LIMIT 1").fetchone() is None:
+            self._backfill_sketches()
+
+        # Raw snapshot rows per item; once there are more than chunk_size of
+        # them, the oldest chunk_size are sealed into one compressed chunk
+        self.chunk_size: int = chunk_size
+        self._raw_snapshots: dict[str, int] = dict(self.db.execute("SELECT item_id, COUNT(*) FROM snapshots GROUP BY item_id"))
+        for item_id in list(self._raw_snapshots):
+            self._seal_snapshots(item_id)
+        self.db.commit()
+
+    def is_empty(self) -> bool:
+        return self.db.execute("SELECT 1 FROM items LIMIT 1").fetchone() is None
+
+    def migrate_json(self, json_path: str = "assets/data.json") -> bool:
+        """ Imports a legacy data.json into an empty store, then renames the file out of the way """
+        if not os.path.exists(json_path) or not self.is_empty():
+            return False
+
+        print(f"[ Migrating '{json_path}' into '{self.path}'... ]")
+        with open(json_path, "r") as f:
+            legacy = json.load(f)
+
+        now = time.time()
+        with self.db:
+            for item_id, item in legacy.items():
+                self.db.execute(
+                    "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)",
+                    (item_id, item.get("name"), item.get("type"), json.dumps(item.get("tags")), item.get("asset_url"))
+                )
+                sold = item.get("sold", [])
+                self.db.executemany("INSERT INTO sales VALUES (?, ?, ?)", ((item_id, price, sold_at) for price, sold_at in sold))
+                # Rollups and sketches only backfill into empty tables, and that is no longer true once a new sale lands
+                for price, sold_at in sold:
+                    if price:
+                        self._roll_up(item_id, price, sold_at)
+                        self._sketch_sale(item_id, price, sold_at)
+                if item.get("data"):
+                    self.db.execute("INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (item_id, now, *item["data"]))
+            self._flush_sketches()
+
+        os.replace(json_path, f"{json_path}.migrated")
+        print(f"[ Migrated {len(legacy)} items ]")
+        return True
+
+    def load(self, history_dir: str = None, lazy: bool = False) -> dict:
+        """ Rebuilds the in-memory market dict used by the bot
+
+        With `history_dir` set, each item's sales are memory-mapped from files
+        in that directory and only re-read from the database when they are
+        out of step with it. With `lazy` set, sales are not read at all and
+        every item starts with an empty history for load_history to fill in.
+        """
+        data = {}
+        if history_dir:
+            os.makedirs(history_dir, exist_ok=True)
+
+        for item_id, name, item_type, tags, asset_url in self.db.execute("SELECT * FROM items"):
+            data[item_id] = {
+                "name": name,
+                "type": item_type,
+                "tags": json.loads(tags) if tags else None,
+                "asset_url": asset_url,
+                "sold": PriceHistory() if lazy or not history_dir else PriceHistory.open(os.path.join(history_dir, item_id)),
+                "data": None
+            }
+
+        if lazy:
+            # Histories are filled in later, one item at a time, by load_history
+            pass
+        elif history_dir:
+            counts = dict(self.db.execute("SELECT item_id, COUNT(*) FROM sales GROUP BY item_id"))
+            for item_id, item in data.items():
+                if len(item["sold"]) != counts.get(item_id, 0):
+                    self._read_sales(item_id, item["sold"])
+        else:
+            for item_id, price, sold_at in self.db.execute("SELECT item_id, price, sold_at FROM sales ORDER BY rowid"):
+                if item_id in data:
+                    data[item_id]["sold"].append(price, sold_at)
+
+        # rowid order is insertion order, so the last row per item is its latest snapshot
+        for item_id, *values in self.db.execute(f"""
+            SELECT item_id, {", ".join(SNAPSHOT_FIELDS)} FROM snapshots
+            WHERE rowid IN (SELECT MAX(rowid) FROM snapshots GROUP BY item_id)
+        """):
+            if item_id in data:
+                data[item_id]["data"] = list(values)
+
+        return data
+
+    def _read_sales(self, item_id: str, history: PriceHistory) -> None:
+        history.clear()
+        for price, sold_at in self.db.execute("SELECT price, sold_at FROM sales WHERE item_id = ? ORDER BY rowid", (item_id,)):
+            history.append(price, sold_at)
+
+    def load_history(self, item_id: str, history_dir: str = None) -> PriceHistory:
+        """ Reads one item's sales, for data loaded with `lazy` """
+        if not history_dir:
+            history = PriceHistory()
+            self._read_sales(item_id, history)
+            return history
+
+        history = PriceHistory.open(os.path.join(history_dir, item_id))
+        count, = self.db.execute("SELECT COUNT(*) FROM sales WHERE item_id = ?", (item_id,)).fetchone()
+        if len(history) != count:
+            self._read_sales(item_id, history)
+        return history
+
+    def add_item(self, item_id: str, name: str, item_type: str, tags: list, asset_url: str) -> None:
+        self.db.execute(
+            "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)",
+            (item_id, name, item_type, json.dumps(tags), asset_url)
+        )
+
+    def append_sale(self, item_id: str, price: int | None, sold_at: float) -> None:
+        self.db.execute("INSERT INTO sales VALUES (?, ?, ?)", (item_id, price, sold_at))
+        if price:
+            self._roll_up(item_id, price, sold_at)
+            self._sketch_sale(item_id, price, sold_at)
+
+    def _roll_up(self, item_id: str, price: int, sold_at: float) -> None:
+        self.db.executemany("""
+            INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)
+            ON CONFLICT (item_id, resolution, bucket) DO UPDATE SET
+                high = max(high, excluded.high),
+                low = min(low, excluded.low),
+                close = excluded.close,
+                volume = volume + 1,
+                total = total + excluded.total
+        """, [
+            (item_id, resolution, sold_at - sold_at % resolution, price, price, price, price, price)
+            for resolution in ROLLUP_RESOLUTIONS.values()
+        ])
+
+    def _backfill_rollups(self) -> None:
+        """ Builds rollups for sales recorded before rollups existed """
+        rows = self.db.execute("SELECT item_id, price, sold_at FROM sales WHERE price ORDER BY rowid").fetchall()
+        if not rows:
+            return
+
+        print(f"[ Building rollups for {len(rows)} existing sales... ]")
+        with self.db:
+            for item_id, price, sold_at in rows:
+                self._roll_up(item_id, price, sold_at)
+
+    def _sketch_sale(self, item_id: str, price: int, sold_at: float) -> None:
+        key = (item_id, sold_at - sold_at % SKETCH_BUCKET)
+        sketch = self._sketches.get(key)
+        if sketch is None:
+            row = self.db.execute("SELECT sketch FROM sketches WHERE item_id = ? AND bucket = ?", key).fetchone()
+            sketch = self._sketches[key] = QuantileSketch.from_bytes(row[0]) if row else QuantileSketch()
+        sketch.add(price)
+
+    def _flush_sketches(self) -> None:
+        if not self._sketches:
+            return
+        self.db.executemany(
+            "INSERT OR REPLACE INTO sketches VALUES (?, ?, ?)",
+            [(item_id, bucket, sketch.to_bytes()) for (item_id, bucket), sketch in self._sketches.items()]
+        )
+        self._sketches.clear()
+
+    def _backfill_sketches(self) -> None:
+        """ Builds sketches for sales recorded before sketches existed
+
+        Sales already dropped by compact_sales() cannot be recovered, so those
+        only count towards the rollups.
+        """
+        rows = self.db.execute("SELECT item_id, price, sold_at FROM sales WHERE price ORDER BY rowid").fetchall()
+        if not rows:
+            return
+
+        print(f"[ Building price sketches for {len(rows)} existing sales... ]")
+        with self.db:
+            for item_id, price, sold_at in rows:
+                self._sketch_sale(item_id, price, sold_at)
+            self._flush_sketches()
+
+    def sale_quantiles(self, item_id: str, qs: tuple[float, ...] = (0.1, 0.5, 0.9), start: float = 0, end: float = float("inf")) -> tuple[list[float | None], int]:
+        """ Approximate sale price quantiles of an item over [start, end], and the number of sales they cover
+
+        Merges the per-bucket sketches the range touches, so `start` and `end`
+        are effectively rounded out to whole buckets.
+        """
+        self._flush_sketches()
+        merged = QuantileSketch()
+        for (blob,) in self.db.execute(
+            "SELECT sketch FROM sketches WHERE item_id = ? AND bucket BETWEEN ? AND ?",
+            (item_id, start - start % SKETCH_BUCKET, end)
+        ):
+            merged.merge(QuantileSketch.from_bytes(blob))
+        return merged.quantiles(qs), len(merged)
+
+    def rollup_series(self, item_id: str, resolution: int, start: float = 0, end: float = float("inf")) -> list[tuple]:
+        """ (bucket, open, high, low, close, volume, total) rows of one resolution, oldest first """
+        return self.db.execute("""
+            SELECT bucket, open, high, low, close, volume, total FROM rollups
+            WHERE item_id = ? AND resolution = ? AND bucket BETWEEN ? AND ?
+            ORDER BY bucket
+        """, (item_id, resolution, start, end)).fetchall()
+
+    def finest_fitting_rollups(self, item_id: str, max_points: int) -> list[tuple]:
+        """ The finest rollup series of an item that still has at most `max_points` buckets """
+        for resolution in sorted(ROLLUP_RESOLUTIONS.values()):
+            count, = self.db.execute(
+                "SELECT COUNT(*) FROM rollups WHERE item_id = ? AND resolution = ?",
+                (item_id, resolution)
+            ).fetchone()
+            if count <= max_points:
+                break
+        return self.rollup_series(item_id, resolution)
+
+    def sale_totals(self) -> dict[str, tuple[int, int]]:
+        """ All-time (sum of prices, number of priced sales) per item, from the daily rollups """
+        return {
+            item_id: (total, volume)
+            for item_id, total, volume in self.db.execute(
+                "SELECT item_id, SUM(total), SUM(volume) FROM rollups WHERE resolution = ? GROUP BY item_id",
+                (ROLLUP_RESOLUTIONS["day"],)
+            )
+        }
+
+    def compact_sales(self, before: float) -> int:
+        """ Drops raw sales older than `before`; they live on in the rollups
+
+        Each item's newest MIN_RAW_SALES priced sales, and everything after
+        them, are always kept; ingest compares incoming results against the
+        newest sale, and the 10/100 sale RAP is rebuilt from them on startup.
+        """
+        deleted = self.db.execute("""
+            DELETE FROM sales WHERE rowid IN (
+                SELECT sales.rowid FROM sales JOIN (
+                    SELECT item_id, rowid AS keep_from FROM (
+                        SELECT item_id, rowid, ROW_NUMBER() OVER (PARTITION BY item_id ORDER BY rowid DESC) AS n
+                        FROM sales WHERE price
+                    ) WHERE n = ?
+                ) USING (item_id)
+                WHERE sold_at < ? AND sales.rowid < keep_from
+            )
+        """, (MIN_RAW_SALES, before)).rowcount
+        self.db.commit()
+        return deleted
+
+    def add_watch(self, user_id: int, item_id: str, direction: str, price: int, created_at: float) -> int:
+        watch_id = self.db.execute(
+            "INSERT INTO watches (user_id, item_id, direction, price, created_at) VALUES (?, ?, ?, ?, ?)",
+            (user_id, item_id, direction, price, created_at)
+        ).lastrowid
+        self.db.commit()
+        return watch_id
+
+    def remove_watches(self, watch_ids: list[int], commit: bool = True) -> None:
+        """ Deletes watches; with `commit` off they are saved by the next commit(), e.g. a scan pass's """
+        self.db.executemany("DELETE FROM watches WHERE id = ?", [(watch_id,) for watch_id in watch_ids])
+        if commit:
+            self.db.commit()
+
+    def load_watches(self) -> list[tuple]:
+        """ Every (id, user_id, item_id, direction, price) price watch """
+        return self.db.execute("SELECT id, user_id, item_id, direction, price FROM watches").fetchall()
+
+    def append_snapshot(self, item_id: str, taken_at: float, values: list) -> None:
+        self.db.execute("INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?)", (item_id, taken_at, *values))
+        self._raw_snapshots[item_id] = self._raw_snapshots.get(item_id, 0) + 1
+        self._seal_snapshots(item_id)
+
+    def _seal_snapshots(self, item_id: str) -> None:
+        # The newest row always stays raw so load() can find the latest snapshot cheaply
+        while self._raw_snapshots.get(item_id, 0) > self.chunk_size:
+            rows = self.db.execute(f"""
+                SELECT rowid, taken_at, {", ".join(SNAPSHOT_FIELDS)} FROM snapshots
+                WHERE item_id = ? ORDER BY rowid LIMIT ?
+            """, (item_id, self.chunk_size)).fetchall()
+
+            samples = [(taken_at, list(values)) for _, taken_at, *values in rows]
+            self.db.execute(
+                "INSERT INTO snapshot_chunks VALUES (?, ?, ?, ?, ?)",
+                (item_id, samples[0][0], samples[-1][0], len(samples), encode_chunk(samples))
+            )
+            self.db.execute(f"DELETE FROM snapshots WHERE rowid IN ({', '.join('?' * len(rows))})", [row[0] for row in rows])
+            self._raw_snapshots[item_id] -= len(rows)
+
+    def snapshot_history(self, item_id: str, start: float = 0, end: float = float("inf")) -> list[tuple[float, list]]:
+        """ Every recorded order-book snapshot of an item taken within [start, end], oldest first """
+        history = []
+        for (samples,) in self.db.execute(
+            "SELECT samples FROM snapshot_chunks WHERE item_id = ? AND end_at >= ? AND start_at <= ? ORDER BY start_at",
+            (item_id, start, end)
+        ):
+            history += [sample for sample in decode_chunk(samples) if start <= sample[0] <= end]
+
+        for taken_at, *values in self.db.execute(f"""
+            SELECT taken_at, {", ".join(SNAPSHOT_FIELDS)} FROM snapshots
+            WHERE item_id = ? AND taken_at BETWEEN ? AND ? ORDER BY rowid
+        """, (item_id, start, end)):
+            history.append((taken_at, list(values)))
+
+        return history
+
+    def commit(self) -> None:
+        self._flush_sketches()
+        self.db.commit()
+
+    def close(self) -> None:
+        self._flush_sketches()
+        self.db.commit()
+        self.db.close()
@@ -0,0 +1,521 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+import time
+import aiohttp
+import base64
+import json
+import functools
+import os
+import asyncio
+
+from capture import CaptureWriter
+from pool import ConnectionPool
+from item_details import ItemDetails, Unchanged, json_loads, parse_item_details, parse_marketable_item
+from metrics import UBISOFT_GRAPHQL_ERRORS, UBISOFT_LOGINS, UBISOFT_REQUEST_SECONDS, UBISOFT_UNAUTHORIZED
+
+class FailedToConnect(Exception):
+    pass
+class InvalidRequest(Exception):
+    def __init__(self, *args, code=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.code = code
+class InvalidAttributeCombination(Exception):
+    pass
+
+
+class Auth:
+    """ Holds the authentication information """
+
+    @staticmethod
+    def get_basic_token(email: str, password: str) -> str:
+        return base64.b64encode(f"{email}:{password}".encode("utf-8")).decode("utf-8")
+
+    def __init__(
+            self,
+            email: str = None,
+            password: str = None,
+            token: str = None,
+            appid: str = None,
+            creds_path: str = None,
+            cachetime: int = 120,
+            max_connect_retries: int = 1,
+            session: aiohttp.ClientSession = None,
+            refresh_session_period: int = -1,
+            item_id: str = "",
+            expiry_margin: int = 60,
+            refresh_ahead: int = 300,
+            base_url: str = "https://public-ubiservices.ubi.com",
+            pool: ConnectionPool = None,
+            capture: CaptureWriter = None,
+    ):
+        print("[ - Generating session data... ]")
+        # A pool handed in is shared with other clients, so only our own gets closed with us
+        self.pool: ConnectionPool = pool or ConnectionPool(session=session)
+        self._owns_pool: bool = pool is None
+        # Raw GraphQL responses are also handed here when set, for later replays
+        self.capture: CaptureWriter | None = capture
+        self.max_connect_retries: int = max_connect_retries
+        self.refresh_session_period: int = refresh_session_period
+
+        print("[ - Generating token data... ]")
+        self.token: str = token or Auth.get_basic_token(email, password)
+        self.creds_path: str = creds_path or f"{os.getcwd()}/creds/{self.token}.json"
+        self.appid: str = appid or 'e3d5ea9e-50bd-43b7-88bf-39794f4e3d40'
+        self.base_url: str = base_url
+        self.sessionid: str = ""
+        self.key: str = ""
+        self.new_key: str = ""
+        self.spaceid: str = ""
+        self.spaceids: dict[str: str] = {
+            "uplay": "0d2ae42d-4c27-4cb7-af6c-2099062302bb",
+            "psn": "0d2ae42d-4c27-4cb7-af6c-2099062302bb",
+            "xbl": "0d2ae42d-4c27-4cb7-af6c-2099062302bb"
+        }
+        self.profileid: str = ""
+        self.userid: str = ""
+        self.expiration: str = ""
+        self.new_expiration: str = ""
+        self.item_id: str = item_id
+        self.expiry_margin: int = expiry_margin
+        self.refresh_ahead: int = refresh_ahead
+        self._creds_loaded: bool = False
+        self._connect_lock: asyncio.Lock = asyncio.Lock()
+        self._refresher: asyncio.Task | None = None
+
+        print("[ - Generating cache data... ]")
+        self.cachetime: int = cachetime
+        self.cache = {}
+
+        print("[ - Generating time data... ]")
+        self._login_cooldown: int = 0
+        self._session_start: float = time.time()
+
+    async def _ensure_session_valid(self) -> None:
+        if 0 <= self.refresh_session_period <= (time.time() - self._session_start):
+            await self.refresh_session()
+
+    async def refresh_session(self) -> None:
+        """ Replaces the pooled session, letting in-flight requests finish on the old one """
+        self.pool.recycle()
+        self._session_start = time.time()
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """ Retrieves the current session, ensuring it's valid first """
+        await self._ensure_session_valid()
+        return self.pool.session()
+
+    async def _send(self, session: aiohttp.ClientSession, method: str, *args, **kwargs) -> aiohttp.ClientResponse:
+        """ Sends one request and reads its body, recycling the pool if the connection failed """
+        try:
+            resp = await session.request(method, *args, **kwargs)
+            await resp.read()
+            return resp
+        except aiohttp.ClientConnectionError:
+            self.pool.recycle(session)
+            raise
+
+    def save_creds(self) -> None:
+        """ Saves the credentials to a file """
+
+        if not os.path.exists(os.path.dirname(self.creds_path)):
+            os.makedirs(os.path.dirname(self.creds_path))
+
+        # write to a temporary file first so a crash can't leave half a file behind
+        with open(f'{self.creds_path}.tmp', 'w') as f:
+            json.dump({
+                "sessionid": self.sessionid,
+                "key": self.key,
+                "new_key": self.new_key,
+                "spaceid": self.spaceid,
+                "profileid": self.profileid,
+                "userid": self.userid,
+                "expiration": self.expiration,
+                "new_expiration": self.new_expiration,
+            }, f, indent=4)
+        os.replace(f'{self.creds_path}.tmp', self.creds_path)
+
+    def load_creds(self) -> None:
+        """ Loads the credentials from a file """
+
+        if not os.path.exists(self.creds_path):
+            return
+
+        with open(self.creds_path, "r") as f:
+            data = json.load(f)
+
+        self.sessionid = data.get("sessionid", "")
+        self.key = data.get("key", "")
+        self.new_key = data.get("new_key", "")
+        self.spaceid = data.get("spaceid", "")
+        self.profileid = data.get("profileid", "")
+        self.userid = data.get("userid", "")
+        self.expiration = data.get("expiration", "")
+        self.new_expiration = data.get("new_expiration", "")
+
+        self._login_cooldown = 0
+
+    @staticmethod
+    def _expires_at(expiration: str) -> float:
+        """ Converts a Ubisoft expiration stamp into a unix timestamp """
+        if not expiration:
+            return 0
+        try:
+            return datetime.fromisoformat(expiration[:26]+"+00:00").timestamp()
+        except ValueError:
+            return 0
+
+    def ticket_valid(self, new: bool = False) -> bool:
+        """ Whether a ticket exists and won't expire within the expiry margin """
+        key, expiration = (self.new_key, self.new_expiration) if new else (self.key, self.expiration)
+        return bool(key) and Auth._expires_at(expiration) - self.expiry_margin > time.time()
+
+    async def _login(self, _new: bool = False) -> None:
+        """ Requests a fresh ticket from Ubisoft """
+        UBISOFT_LOGINS.inc(ticket="new" if _new else "primary")
+        session = await self.get_session()
+        headers = {
+            "User-Agent": "UbiServices_SDK_2020.Release.58_PC64_ansi_static",
+            "Content-Type": "application/json; charset=UTF-8",
+            "Ubi-AppId": self.appid,
+            "Authorization": "Basic " + self.token
+        }
+
+        if _new:
+            headers["Ubi-AppId"] = self.appid
+            headers["Authorization"] = "Ubi_v1 t=" + self.key
+
+        resp = await self._send(
+            session,
+            "POST",
+            f"{self.base_url}/v3/profiles/sessions",
+            headers=headers,
+            data=json.dumps({"rememberMe": True})
+        )
+
+        data = await resp.json(loads=json_loads)
+
+        if "ticket" in data:
+            if _new:
+                self.new_key = data.get('ticket')
+                self.new_expiration = data.get('expiration')
+            else:
+                self.key = data.get("ticket")
+                self.expiration = data.get("expiration")
+            self.profileid = data.get('profileId')
+            self.sessionid = data.get("sessionId")
+            self.spaceid = data.get("spaceId")
+            self.userid = data.get("userId")
+            print("[ Logged in successfully ]")
+        else:
+            message = "Unknown Error"
+            if "message" in data and "httpCode" in data:
+                message = f"HTTP {data['httpCode']}: {data['message']}"
+            elif "message" in data:
+                message = data["message"]
+            elif "httpCode" in data:
+                message = str(data["httpCode"])
+            print(f"[ Error: \"{message}\" ]")
+            raise FailedToConnect(message)
+
+    async def connect(self, force: bool = False, stale: str = None) -> None:
+        """ Connect to Ubisoft, automatically called when needed
+
+        Concurrent callers share one login: whoever holds the lock logs in,
+        and everyone waiting behind it reuses the tickets it fetched. Passing
+        the ticket that was just rejected as `stale` forces a re-login only
+        if nobody has replaced that ticket yet.
+        """
+        async with self._connect_lock:
+            if not self._creds_loaded:
+                self.load_creds()
+                self._creds_loaded = True
+
+            if stale is not None:
+                if stale not in (self.key, self.new_key):
+                    return
+                force = True
+
+            # If keys are still valid, don't connect again
+            if not force and self.ticket_valid() and self.ticket_valid(new=True):
+                return
+
+            if self._login_cooldown > time.time():
+                raise FailedToConnect("Login on cooldown")
+
+            if force or not self.ticket_valid():
+                await self._login()
+                await self._login(_new=True)
+            elif not self.ticket_valid(new=True):
+                await self._login(_new=True)
+
+            self.save_creds()
+
+        self.start_refresher()
+
+    def start_refresher(self) -> None:
+        """ Starts renewing tickets in the background before they expire """
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.ensure_future(self._refresh_loop())
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            expires = min(Auth._expires_at(self.expiration), Auth._expires_at(self.new_expiration))
+            await asyncio.sleep(max(30, expires - self.refresh_ahead - time.time()))
+
+            try:
+                print("[ Refreshing tickets ahead of expiry... ]")
+                await self.connect(force=True)
+            except Exception as e:
+                print(f"[ Failed to refresh tickets for reason \"{e}\" ]")
+
+    async def _ensure_connected(self, new: bool = False) -> None:
+        if self.ticket_valid(new=new):
+            return
+
+        last_error = None
+        for _ in range(self.max_connect_retries):
+            try:
+                await self.connect()
+                return
+            except FailedToConnect as e:
+                last_error = e
+
+                print(f"[ Failed to connect for reason \"{e}\" ]")
+
+        if last_error:
+            raise last_error
+        else:
+            raise FailedToConnect("Unknown Error")
+
+    def _headers(self, headers: dict | None, new: bool = False) -> tuple[dict, str]:
+        """ Fills in the Ubisoft headers, returning them with the ticket used """
+        headers = dict(headers or {})
+        key = self.new_key if new else self.key
+
+        headers["Authorization"] = headers.get("Authorization") or "Ubi_v1 t=" + key
+        headers["Ubi-AppId"] = headers.get("Ubi-AppId") or self.appid
+        headers["Ubi-LocaleCode"] = headers.get("Ubi-LocaleCode") or "en-US"
+        headers["Ubi-SessionId"] = headers.get("Ubi-SessionId") or self.sessionid
+        headers["User-Agent"] = headers.get("User-Agent") or "UbiServices_SDK_2020.Release.58_PC64_ansi_static"
+        headers["Connection"] = headers.get("Connection") or "keep-alive"
+        headers["expiration"] = headers.get("expiration") or self.expiration
+
+        return headers, key
+
+    async def close(self) -> None:
+        """ Stops refreshing tickets and closes the connection pool, unless it is shared """
+        if self._refresher is not None:
+            self._refresher.cancel()
+        self.save_creds()
+        if self._owns_pool:
+            await self.pool.close()
+
+    async def get(self, *args, retries: int = 0, json_: bool = True, new: bool = False, headers: dict = None, **kwargs) -> dict | str:
+        await self._ensure_connected(new=new)
+        request_headers, key = self._headers(headers, new=new)
+
+        session = await self.get_session()
+        resp = await self._send(session, "GET", *args, headers=request_headers, **kwargs)
+
+        if json_:
+            try:
+                data = await resp.json(loads=json_loads)
+            except Exception:
+                text = await resp.text()
+                message = text.split("h1>")
+                message = message[1][:-2] if len(message) > 1 else text
+                raise InvalidRequest(f"Received a text response, expected JSON response. Message: {message}")
+
+            if "httpCode" in data:
+                if data["httpCode"] == 401:
+                    UBISOFT_UNAUTHORIZED.inc()
+                    if retries >= self.max_connect_retries:
+                        # wait 30 seconds before sending another request
+                        self._login_cooldown = time.time() + 30
+                        raise InvalidRequest("HTTP 401: ticket rejected", code=401)
+
+                    # key no longer works, so replace it (once for all callers) and try again
+                    await self.connect(stale=key)
+                    return await self.get(*args, retries=retries + 1, json_=json_, new=new, headers=headers, **kwargs)
+                else:
+                    msg = data.get("message", "")
+                    if data["httpCode"] == 404:
+                        msg = f"Missing resource {data.get('resource', args[0])}"
+                    raise InvalidRequest(f"HTTP {data['httpCode']}: {msg}", code=data["httpCode"])
+
+            return data
+        else:
+            return await resp.text()
+    async def get_db(self, *args, item_id: str = None, query: dict = None, retries: int = 0, json_: bool = True, new: bool = False, headers: dict = None, **kwargs) -> dict | str:
+        await self._ensure_connected(new=new)
+        request_headers, key = self._headers(headers, new=new)
+        request_headers["content-type"] = "application/json"
+
+        query = query or {
+            "operationName":"GetItemDetails",
+            "variables": {
+                "spaceId":"0d2ae42d-4c27-4cb7-af6c-2099062302bb",
+                "itemId": item_id or self.item_id,
+                "tradeId":"",
+                "fetchTrade":False
+            },
+            "query":"query GetItemDetails($spaceId: String!, $itemId: String!, $tradeId: String!, $fetchTrade: Boolean!) {\n  game(spaceId: $spaceId) {\n    id\n    marketableItem(itemId: $itemId) {\n      id\n      item {\n        ...SecondaryStoreItemFragment\n        ...SecondaryStoreItemOwnershipFragment\n        __typename\n      }\n      marketData {\n        ...MarketDataFragment\n        __typename\n      }\n      paymentLimitations {\n        id\n        paymentItemId\n        minPrice\n        maxPrice\n        __typename\n      }\n      __typename\n    }\n    viewer {\n      meta {\n        id\n        trades(filterBy: {states: [Created], itemIds: [$itemId]}) {\n          nodes {\n            ...TradeFragment\n            __typename\n          }\n          __typename\n        }\n        trade(tradeId: $tradeId) @include(if: $fetchTrade) {\n          ...TradeFragment\n          __typename\n        }\n        __typename\n      }\n      __typename\n    }\n    __typename\n  }\n}\n\nfragment SecondaryStoreItemFragment on SecondaryStoreItem {\n  id\n  assetUrl\n  itemId\n  name\n  tags\n  type\n  viewer {\n    meta {\n      id\n      isReserved\n      __typename\n    }\n    __typename\n  }\n  __typename\n}\n\nfragment SecondaryStoreItemOwnershipFragment on SecondaryStoreItem {\n  viewer {\n    meta {\n      id\n      isOwned\n      quantity\n      __typename\n    }\n    __typename\n  }\n  __typename\n}\n\nfragment MarketDataFragment on MarketableItemMarketData {\n  id\n  sellStats {\n    id\n    paymentItemId\n    lowestPrice\n    highestPrice\n    activeCount\n    __typename\n  }\n  buyStats {\n    id\n    paymentItemId\n    lowestPrice\n    highestPrice\n    activeCount\n    __typename\n  }\n  lastSoldAt {\n    id\n    paymentItemId\n    price\n    performedAt\n    __typename\n  }\n  __typename\n}\n\nfragment TradeFragment on Trade {\n  id\n  tradeId\n  state\n  category\n  createdAt\n  expiresAt\n  lastModifiedAt\n  failures\n  tradeItems {\n    id\n    item {\n      ...SecondaryStoreItemFragment\n      ...SecondaryStoreItemOwnershipFragment\n      __typename\n    }\n    __typename\n  }\n  payment {\n    id\n    item {\n      ...SecondaryStoreItemQuantityFragment\n      __typename\n    }\n    price\n    transactionFee\n    __typename\n  }\n  paymentOptions {\n    id\n    item {\n      ...SecondaryStoreItemQuantityFragment\n      __typename\n    }\n    price\n    transactionFee\n    __typename\n  }\n  paymentProposal {\n    id\n    item {\n      ...SecondaryStoreItemQuantityFragment\n      __typename\n    }\n    price\n    __typename\n  }\n  viewer {\n    meta {\n      id\n      tradesLimitations {\n        ...TradesLimitationsFragment\n        __typename\n      }\n      __typename\n    }\n    __typename\n  }\n  __typename\n}\n\nfragment SecondaryStoreItemQuantityFragment on SecondaryStoreItem {\n  viewer {\n    meta {\n      id\n      quantity\n      __typename\n    }\n    __typename\n  }\n  __typename\n}\n\nfragment TradesLimitationsFragment on UserGameTradesLimitations {\n  id\n  buy {\n    resolvedTransactionCount\n    resolvedTransactionPeriodInMinutes\n    activeTransactionCount\n    __typename\n  }\n  sell {\n    resolvedTransactionCount\n    resolvedTransactionPeriodInMinutes\n    activeTransactionCount\n    resaleLocks {\n      itemId\n      expiresAt\n      __typename\n    }\n    __typename\n  }\n  __typename\n}"
+        }
+        body = json.dumps(query)
+
+        session = await self.get_session()
+        with UBISOFT_REQUEST_SECONDS.time(operation=query["operationName"]):
+            resp = await self._send(session, "POST", *args, headers=request_headers, data=body, **kwargs)
+
+        if self.capture is not None and resp.status == 200:
+            self.capture.write(query["operationName"], query["variables"], await resp.read())
+
+        if json_:
+            try:
+                data = await resp.json(loads=json_loads)
+            except Exception:
+                text = await resp.text()
+                message = text.split("h1>")
+                message = message[1][:-2] if len(message) > 1 else text
+                print(f"[ Error: \"{message}\" ]")
+                raise InvalidRequest(f"Received a text response, expected JSON response. Message: {message}")
+
+            if "httpCode" in data:
+                if data["httpCode"] == 401:
+                    UBISOFT_UNAUTHORIZED.inc()
+                    if retries >= self.max_connect_retries:
+                        # wait 30 seconds before sending another request
+                        self._login_cooldown = time.time() + 30
+                        raise InvalidRequest("HTTP 401: ticket rejected", code=401)
+
+                    print("[ Broken Key! ]")
+
+                    # key no longer works, so replace it (once for all callers) and try again
+                    await self.connect(stale=key)
+                    return await self.get_db(*args, item_id=item_id, query=query, retries=retries + 1, json_=json_, new=new, headers=headers, **kwargs)
+                else:
+                    msg = data.get("message", "")
+                    if data["httpCode"] == 404:
+                        msg = f"Missing resource {data.get('resource', args[0])}"
+
+                    print(f"[ Error: \"{msg}\" ]")
+                    raise InvalidRequest(f"HTTP {data['httpCode']}: {msg}", code=data["httpCode"])
+
+            return data
+        else:
+            return await resp.text()
+    async def try_query_db(self, item_id: str = None, known: int = None) -> ItemDetails | Unchanged | int:
+        res = await self.get_db(f"{self.base_url}/v1/profiles/me/uplay/graphql", item_id=item_id)
+
+        failed = False
+        try:
+            UBISOFT_GRAPHQL_ERRORS.inc(len(res["errors"]))
+            failed = True
+            print("Rate Limited!")
+        except:
+            pass
+        if (failed):
+            return -1
+
+        return parse_item_details(res, known)
+
+    async def try_query_db_batch(self, item_ids: list[str], known: dict[str, int] = None) -> dict[str, ItemDetails | Unchanged] | int:
+        """ Queries several items in a single request using GraphQL aliases
+
+        Items missing from the response are left out of the returned dict so
+        the caller can retry them on their own. If the whole batch failed,
+        -1 is returned instead, matching try_query_db. `known` maps item ids
+        to the marketData fingerprints already ingested for them.
+        """
+        known = known or {}
+        res = await self.get_db(
+            f"{self.base_url}/v1/profiles/me/uplay/graphql",
+            query=build_batch_query(item_ids)
+        )
+
+        game = (res.get("data") or {}).get("game") if isinstance(res, dict) else None
+        if not game:
+            UBISOFT_GRAPHQL_ERRORS.inc(len(res.get("errors", [])) if isinstance(res, dict) else 1)
+            print("Rate Limited!")
+            return -1
+        if "errors" in res:
+            UBISOFT_GRAPHQL_ERRORS.inc(len(res["errors"]))
+            print(f'[ Batch partially failed: {len(res["errors"])} error(s) ]')
+
+        results = {}
+        for i, item_id in enumerate(item_ids):
+            block = game.get(f'item{i}')
+            if not block:
+                continue
+            results[item_id] = parse_marketable_item(block, known.get(item_id))
+        return results
+
+    async def iter_marketable_items(self, offset: int = 0, page_size: int = 100):
+        """ Pages through the marketplace listing, yielding (next_offset, [(name, item_id), ...]) per page
+
+        Only one page is held at a time. Passing a previously yielded
+        next_offset resumes the walk where it stopped.
+        """
+        while True:
+            res = await self.get_db(
+                f"{self.base_url}/v1/profiles/me/uplay/graphql",
+                query=build_listing_query(offset, page_size)
+            )
+
+            listing = (((res.get("data") or {}).get("game") or {}).get("marketableItems")) if isinstance(res, dict) else None
+            if listing is None:
+                UBISOFT_GRAPHQL_ERRORS.inc(len(res.get("errors", [])) if isinstance(res, dict) else 1)
+                raise InvalidRequest(f"Listing page at offset {offset} failed")
+
+            nodes = listing.get("nodes") or []
+            page = []
+            for node in nodes:
+                item = (node or {}).get("item") or {}
+                if item.get("itemId") and item.get("name"):
+                    page.append((item["name"], item["itemId"]))
+
+            offset += len(nodes)
+            yield offset, page
+
+            if not nodes or offset >= (listing.get("totalCount") or 0):
+                return
+
+ITEM_DETAILS_FRAGMENTS = "fragment SecondaryStoreItemFragment on SecondaryStoreItem {\n  id\n  assetUrl\n  itemId\n  name\n  tags\n  type\n  __typename\n}\n\nfragment MarketDataFragment on MarketableItemMarketData {\n  id\n  sellStats {\n    id\n    paymentItemId\n    lowestPrice\n    highestPrice\n    activeCount\n    __typename\n  }\n  buyStats {\n    id\n    paymentItemId\n    lowestPrice\n    highestPrice\n    activeCount\n    __typename\n  }\n  lastSoldAt {\n    id\n    paymentItemId\n    price\n    performedAt\n    __typename\n  }\n  __typename\n}"
+
+@functools.lru_cache(maxsize=8)
+def _batch_query_text(size: int) -> str:
+    params = ", ".join(f'$itemId{i}: String!' for i in range(size))
+    blocks = "".join(
+        f'    item{i}: marketableItem(itemId: $itemId{i}) {{\n      id\n      item {{\n        ...SecondaryStoreItemFragment\n        __typename\n      }}\n      marketData {{\n        ...MarketDataFragment\n        __typename\n      }}\n      __typename\n    }}\n'
+        for i in range(size)
+    )
+    return f'query GetItemDetailsBatch($spaceId: String!, {params}) {{\n  game(spaceId: $spaceId) {{\n    id\n{blocks}    __typename\n  }}\n}}\n\n{ITEM_DETAILS_FRAGMENTS}'
+
+def build_batch_query(item_ids: list[str]) -> dict:
+    """ Builds one GraphQL request that aliases a marketableItem block per item """
+    variables = {"spaceId": "0d2ae42d-4c27-4cb7-af6c-2099062302bb"}
+    for i, item_id in enumerate(item_ids):
+        variables[f'itemId{i}'] = item_id
+
+    return {
+        "operationName": "GetItemDetailsBatch",
+        "variables": variables,
+        "query": _batch_query_text(len(item_ids))
+    }
+
+LISTING_QUERY = "query GetMarketableItems($spaceId: String!, $limit: Int!, $offset: Int, $sortBy: MarketableItemSort) {\n  game(spaceId: $spaceId) {\n    id\n    marketableItems(limit: $limit, offset: $offset, sortBy: $sortBy, withMarketData: true) {\n      nodes {\n        id\n        item {\n          ...SecondaryStoreItemFragment\n          __typename\n        }\n        __typename\n      }\n      totalCount\n      __typename\n    }\n    __typename\n  }\n}\n\nfragment SecondaryStoreItemFragment on SecondaryStoreItem {\n  id\n  assetUrl\n  itemId\n  name\n  tags\n  type\n  __typename\n}"
+
+def build_listing_query(offset: int, limit: int) -> dict:
+    """ Builds one page of the marketplace listing, in a stable order so offsets can be resumed """
+    return {
+        "operationName": "GetMarketableItems",
+        "variables": {
+            "spaceId": "0d2ae42d-4c27-4cb7-af6c-2099062302bb",
+            "limit": limit,
+            "offset": offset,
+            "sortBy": {"field": "ITEM_ID", "direction": "ASC", "paymentItemId": "9ef71262-515b-46e8-b9a8-b6b6ad456c67"}
+        },
+        "query": LISTING_QUERY
+    }
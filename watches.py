@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import bisect
+from collections import defaultdict
+from dataclasses import dataclass
+
+DIRECTIONS = ("below", "above")
+
+
+@dataclass(slots=True)
+class Watch:
+    id: int
+    user_id: int
+    item_id: str
+    direction: str
+    price: int
+
+
+class WatchIndex:
+    """ Price watches, kept per item as sorted threshold lists
+
+    A new price for an item only has to bisect that item's lists: every
+    "below" watch at or above the price and every "above" watch at or below
+    it is crossed, and nothing else is looked at. Watches fire once and are
+    then dropped.
+    """
+
+    def __init__(self):
+        self.watches: dict[int, Watch] = {}
+        self._below: dict[str, list[tuple[int, int]]] = defaultdict(list)
+        self._above: dict[str, list[tuple[int, int]]] = defaultdict(list)
+
+    @classmethod
+    def from_rows(cls, rows) -> WatchIndex:
+        index = cls()
+        for row in rows:
+            index.add(Watch(*row))
+        return index
+
+    def _thresholds(self, direction: str) -> dict[str, list[tuple[int, int]]]:
+        return self._below if direction == "below" else self._above
+
+    def add(self, watch: Watch) -> None:
+        self.watches[watch.id] = watch
+        bisect.insort(self._thresholds(watch.direction)[watch.item_id], (watch.price, watch.id))
+
+    def remove(self, watch_id: int) -> Watch | None:
+        watch = self.watches.pop(watch_id, None)
+        if watch is not None:
+            thresholds = self._thresholds(watch.direction)[watch.item_id]
+            thresholds.pop(bisect.bisect_left(thresholds, (watch.price, watch.id)))
+        return watch
+
+    def match(self, item_id: str, price: int | None) -> list[Watch]:
+        """ Removes and returns the watches on `item_id` that `price` crosses """
+        if price is None:
+            return []
+
+        below = self._below.get(item_id)
+        above = self._above.get(item_id)
+        crossed = []
+        if below:
+            crossed += below[bisect.bisect_left(below, (price, -1)):]
+        if above:
+            crossed += above[:bisect.bisect_right(above, (price, float("inf")))]
+        return [self.remove(watch_id) for _, watch_id in crossed]
+
+    def for_user(self, user_id: int) -> list[Watch]:
+        return [watch for watch in self.watches.values() if watch.user_id == user_id]
+
+    def __len__(self) -> int:
+        return len(self.watches)